@@ -3,7 +3,7 @@ from logging.config import fileConfig
 from sqlalchemy import engine_from_config, pool
 
 from alembic import context
-from src.models.model import metadata
+from src.models.model import MIGRATION_ONLY_SCHEMA, metadata
 from src.settings import db_settings
 
 # this is the Alembic Config object, which provides
@@ -42,6 +42,11 @@ config.compare_type = True
 config.compare_server_default = True
 
 
+def include_object(object, name, type_, reflected, compare_to) -> bool:
+    # in the database but not in the metadata on purpose, don't drop it
+    return not (reflected and compare_to is None and name in MIGRATION_ONLY_SCHEMA)
+
+
 def run_migrations_offline() -> None:
     """Run migrations in 'offline' mode.
 
@@ -58,6 +63,7 @@ def run_migrations_offline() -> None:
     context.configure(
         url=url,
         target_metadata=target_metadata,
+        include_object=include_object,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
     )
@@ -83,6 +89,7 @@ def run_migrations_online() -> None:
         context.configure(
             connection=connection,
             target_metadata=target_metadata,
+            include_object=include_object,
         )
 
         with context.begin_transaction():
@@ -0,0 +1,40 @@
+"""package search indexes
+
+Revision ID: 388e6875098e
+Revises: 2f89cc88376e
+Create Date: 2026-10-18 15:21:44.870215
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '388e6875098e'
+down_revision: Union[str, None] = '2f89cc88376e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# full text search document of a package, weighted name > summary > description
+SEARCH_DOCUMENT = (
+    "setweight(to_tsvector('simple'::regconfig, id), 'A') || "
+    "setweight(to_tsvector('simple'::regconfig, coalesce(summary, '')), 'B') || "
+    "setweight(to_tsvector('simple'::regconfig, "
+    "left(coalesce(description, ''), 20000)), 'C')"
+)
+
+
+def upgrade() -> None:
+    if op.get_context().dialect.name != 'postgresql':
+        return
+    op.create_index('ix_package_search_document', 'package', [sa.text(SEARCH_DOCUMENT)], unique=False, postgresql_using='gin')
+    op.create_index('ix_package_id_lower', 'package', [sa.text('lower(id) text_pattern_ops')], unique=False)
+
+
+def downgrade() -> None:
+    if op.get_context().dialect.name != 'postgresql':
+        return
+    op.drop_index('ix_package_id_lower', table_name='package')
+    op.drop_index('ix_package_search_document', table_name='package')
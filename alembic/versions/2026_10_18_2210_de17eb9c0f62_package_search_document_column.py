@@ -0,0 +1,44 @@
+"""package search document column
+
+Revision ID: de17eb9c0f62
+Revises: 388e6875098e
+Create Date: 2026-10-18 22:10:37.512804
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'de17eb9c0f62'
+down_revision: Union[str, None] = '388e6875098e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# the document indexed by revision 388e6875098e, now stored
+SEARCH_DOCUMENT = (
+    "setweight(to_tsvector('simple'::regconfig, id), 'A') || "
+    "setweight(to_tsvector('simple'::regconfig, coalesce(summary, '')), 'B') || "
+    "setweight(to_tsvector('simple'::regconfig, "
+    "left(coalesce(description, ''), 20000)), 'C')"
+)
+
+
+def upgrade() -> None:
+    if op.get_context().dialect.name != 'postgresql':
+        return
+    # stored, so ranking matches doesn't rebuild the document of every row
+    op.drop_index('ix_package_search_document', table_name='package')
+    op.add_column('package', sa.Column('search_document', postgresql.TSVECTOR(), sa.Computed(SEARCH_DOCUMENT, persisted=True), nullable=True))
+    op.create_index('ix_package_search_document', 'package', ['search_document'], unique=False, postgresql_using='gin')
+
+
+def downgrade() -> None:
+    if op.get_context().dialect.name != 'postgresql':
+        return
+    op.drop_index('ix_package_search_document', table_name='package')
+    op.drop_column('package', 'search_document')
+    op.create_index('ix_package_search_document', 'package', [sa.text(SEARCH_DOCUMENT)], unique=False, postgresql_using='gin')
@@ -0,0 +1,318 @@
+import asyncio
+import contextlib
+import logging
+import math
+import random
+import struct
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, NamedTuple
+
+from redis.exceptions import LockError, RedisError
+
+from src import redis
+from src.database import detached
+from src.metrics import Gauge, cache_requests
+from src.redis import RedisData, cache_codec, set_redis_keys
+from src.settings import settings
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = "cache_invalidation"
+WORKER_ID = uuid.uuid4().hex
+
+
+class LocalCache:
+    """Per-worker LRU cache bounded by the total size of its values.
+
+    Entries expire after their own ttl, least recently used entries are
+    evicted once max_size is exceeded.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.size = 0
+        self._entries: OrderedDict[str, tuple[float, int, Any]] = OrderedDict()
+
+    def get(self, key: str) -> Any | None:
+        if (entry := self._entries.get(key)) is None:
+            return None
+        expires_at, _size, value = entry
+        if expires_at < time.monotonic():
+            self.delete(key)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, size: int, ttl: float) -> None:
+        if size > self.max_size or ttl <= 0:
+            return
+        self.delete(key)
+        self._entries[key] = (time.monotonic() + ttl, size, value)
+        self.size += size
+        while self.size > self.max_size:
+            _key, (_expires_at, evicted_size, _value) = self._entries.popitem(
+                last=False
+            )
+            self.size -= evicted_size
+
+    def delete(self, key: str) -> None:
+        if (entry := self._entries.pop(key, None)) is not None:
+            self.size -= entry[1]
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.size = 0
+
+
+local_cache = LocalCache(max_size=settings.LOCAL_CACHE_MAX_SIZE)
+Gauge("local_cache_bytes", "Size of the local cache", lambda: local_cache.size)
+
+# seconds a worker may hold the recompute lock of a key
+LOCK_TIMEOUT = 10
+# seconds other workers wait for the lock holder to store the value
+LOCK_WAIT = 2
+LOCK_POLL_INTERVAL = 0.05
+# > 1 refreshes earlier, < 1 later (see should_refresh_early)
+EARLY_REFRESH_BETA = 1.0
+
+# computations awaited by the requests that missed the key
+_inflight: dict[str, asyncio.Task] = {}
+# refreshes of values still served from the cache
+_background_refreshes: dict[str, asyncio.Task] = {}
+
+
+class CacheEntry(NamedTuple):
+    value: Any
+    # seconds it took to compute the value
+    delta: float
+    # time.monotonic() based
+    expires_at: float
+
+
+# compute time of the value, stored in front of it
+DELTA = struct.Struct("!f")
+
+
+def encode_entry(raw: str | bytes, delta: float) -> bytes:
+    if isinstance(raw, str):
+        raw = raw.encode()
+    return cache_codec.encode(DELTA.pack(delta) + raw)
+
+
+def decode_entry(data: bytes) -> tuple[bytes, float] | None:
+    if (payload := cache_codec.decode(data)) is None:
+        return None
+    (delta,) = DELTA.unpack_from(payload)
+    return payload[DELTA.size :], delta
+
+
+async def lookup(key: str, loads: Callable[[bytes], Any]) -> CacheEntry | None:
+    """Local cache first, then redis (the entry is kept locally for as long
+    as the redis key lives)"""
+    return (await lookup_many([key], loads))[key]
+
+
+async def lookup_many(
+    keys: list[str], loads: Callable[[bytes], Any]
+) -> dict[str, CacheEntry | None]:
+    """Like lookup, keys missing locally are read from redis in one round trip"""
+    entries = {key: local_cache.get(key) for key in keys}
+    missing = [key for key, entry in entries.items() if entry is None]
+    cache_requests.inc("local", "hit", amount=len(keys) - len(missing))
+    cache_requests.inc("local", "miss", amount=len(missing))
+    if not missing:
+        return entries
+
+    for key, (data, ttl_ms) in zip(
+        missing, await redis.get_with_ttl(missing), strict=True
+    ):
+        if data is None or (decoded := decode_entry(data)) is None:
+            cache_requests.inc("redis", "miss")
+            continue
+        cache_requests.inc("redis", "hit")
+        raw, delta = decoded
+        ttl = ttl_ms / 1000 if ttl_ms > 0 else math.inf
+        entries[key] = CacheEntry(loads(raw), delta, time.monotonic() + ttl)
+        # the decoded value is held, count its size before compression
+        local_cache.set(key, entries[key], size=len(raw), ttl=ttl)
+    return entries
+
+
+def should_refresh_early(entry: CacheEntry) -> bool:
+    """Probabilistic early expiration (XFetch).
+
+    The closer the expiry and the slower the value is to compute, the more
+    likely a request refreshes it, so a hot key is recomputed once before it
+    expires instead of by every request right after.
+    """
+    jitter = -entry.delta * EARLY_REFRESH_BETA * math.log(1 - random.random())
+    return time.monotonic() + jitter >= entry.expires_at
+
+
+async def get_or_compute(
+    key: str,
+    compute: Callable[[], Awaitable[Any]],
+    loads: Callable[[bytes], Any],
+    dumps: Callable[[Any], str | bytes],
+    ttl: int | Callable[[Any], int],
+    tags: list[str] | None = None,
+) -> Any:
+    """Cached value of key, computed (and stored) by one request at a time.
+
+    Concurrent misses in a worker share one computation, across workers a
+    redis lock lets one of them compute while the others wait for its value.
+    A value close to expiry is served stale while it is refreshed.
+    """
+    entry = await lookup(key, loads)
+    if entry is not None:
+        if key not in _background_refreshes and should_refresh_early(entry):
+            task = start_refresh(key, compute, loads, dumps, ttl, tags, is_miss=False)
+            task.add_done_callback(log_refresh_error)
+        return entry.value
+
+    if (task := _inflight.get(key)) is None:
+        task = start_refresh(key, compute, loads, dumps, ttl, tags, is_miss=True)
+    # a cancelled request must not cancel the computation others wait for
+    return await asyncio.shield(task)
+
+
+def start_refresh(
+    key: str,
+    compute: Callable[[], Awaitable[Any]],
+    loads: Callable[[bytes], Any],
+    dumps: Callable[[Any], str | bytes],
+    ttl: int | Callable[[Any], int],
+    tags: list[str] | None,
+    is_miss: bool,
+) -> asyncio.Task:
+    tasks = _inflight if is_miss else _background_refreshes
+    task = asyncio.create_task(
+        detached(refresh(key, compute, loads, dumps, ttl, tags, is_miss))
+    )
+    tasks[key] = task
+    task.add_done_callback(lambda _: tasks.pop(key, None))
+    return task
+
+
+def log_refresh_error(task: asyncio.Task) -> None:
+    if not task.cancelled() and (error := task.exception()) is not None:
+        logger.error("Cache refresh failed", exc_info=error)
+
+
+async def refresh(
+    key: str,
+    compute: Callable[[], Awaitable[Any]],
+    loads: Callable[[bytes], Any],
+    dumps: Callable[[Any], str | bytes],
+    ttl: int | Callable[[Any], int],
+    tags: list[str] | None,
+    is_miss: bool,
+) -> Any:
+    lock = redis.redis_client.lock(f"lock:{key}", timeout=LOCK_TIMEOUT)
+    if not await lock.acquire(blocking=False):
+        if not is_miss:
+            # another worker is refreshing it, keep serving the current value
+            return None
+        if (entry := await wait_for_value(key, loads)) is not None:
+            return entry.value
+        # the lock holder is too slow, don't keep the request waiting
+        return await compute()
+
+    try:
+        started = time.monotonic()
+        value = await compute()
+        ttl = ttl(value) if callable(ttl) else ttl
+        delta = time.monotonic() - started
+        await set_cached(key, value, dumps, ttl, delta=delta, tags=tags)
+        return value
+    finally:
+        with contextlib.suppress(LockError):
+            await lock.release()
+
+
+async def wait_for_value(key: str, loads: Callable[[bytes], Any]) -> CacheEntry | None:
+    deadline = time.monotonic() + LOCK_WAIT
+    while time.monotonic() < deadline:
+        await asyncio.sleep(LOCK_POLL_INTERVAL)
+        if (entry := await lookup(key, loads)) is not None:
+            return entry
+    return None
+
+
+async def set_cached(
+    key: str,
+    value: Any,
+    dumps: Callable[[Any], str | bytes],
+    ttl: int,
+    delta: float = 0.0,
+    tags: list[str] | None = None,
+) -> None:
+    await set_cached_many({key: value}, dumps, ttl, delta, tags)
+
+
+async def set_cached_many(
+    values: dict[str, Any],
+    dumps: Callable[[Any], str | bytes],
+    ttl: int,
+    delta: float = 0.0,
+    tags: list[str] | None = None,
+) -> None:
+    """Store values (by key) in redis with one round trip and locally"""
+    redis_data = []
+    for key, value in values.items():
+        raw = dumps(value)
+        data = encode_entry(raw, delta)
+        redis_data.append(RedisData(key=key, value=data, ttl=ttl, tags=tags or []))
+        entry = CacheEntry(value, delta, time.monotonic() + ttl)
+        local_cache.set(key, entry, size=len(raw), ttl=ttl)
+    await set_redis_keys(redis_data)
+    await publish_invalidation(*values)
+
+
+async def invalidate(key: str) -> None:
+    local_cache.delete(key)
+    await redis.delete_by_key(key)
+    await publish_invalidation(key)
+
+
+async def invalidate_tag(tag: str) -> None:
+    """Drop every value stored with tag, in redis and in all workers"""
+    keys = await redis.delete_by_tag(tag)
+    for key in keys:
+        local_cache.delete(key)
+    await publish_invalidation(*keys)
+
+
+async def publish_invalidation(*keys: str) -> None:
+    if not keys:
+        return
+    async with redis.redis_client.pipeline(transaction=False) as pipe:
+        for key in keys:
+            pipe.publish(INVALIDATION_CHANNEL, f"{WORKER_ID}:{key}")
+        await pipe.execute()
+
+
+async def listen_invalidations() -> None:
+    """Drop local copies of keys changed by other workers"""
+    while True:
+        try:
+            async with redis.redis_client.pubsub() as pubsub:
+                await pubsub.subscribe(INVALIDATION_CHANNEL)
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        handle_invalidation(message["data"])
+        except RedisError:
+            logger.warning("Lost cache invalidation channel, reconnecting")
+            # invalidations may have been missed meanwhile
+            local_cache.clear()
+            await asyncio.sleep(1)
+
+
+def handle_invalidation(data: str | bytes) -> None:
+    if isinstance(data, bytes):
+        data = data.decode("utf-8")
+    worker_id, _, key = data.partition(":")
+    if worker_id != WORKER_ID:
+        local_cache.delete(key)
@@ -1,4 +1,4 @@
-from typing import Any
+from typing import Any, Literal
 
 from dotenv import find_dotenv, load_dotenv
 from pydantic import PostgresDsn, RedisDsn
@@ -77,6 +77,8 @@ class CookieConfig(BaseSettings):
     SAMESITE_COOKIES: str
     SECRET_KEY: bytes
     AUTH_SIZE: int
+    SESSION_BACKEND: Literal["cookie", "redis"] = "cookie"
+    SESSION_TTL: int = 14 * 24 * 3600
 
 
 class BaseConfig(BaseSettings):
@@ -85,3 +87,23 @@ class BaseConfig(BaseSettings):
     CORS_HEADERS: list[str]
     CORS_ORIGINS: list[str]
     APP_VERSION: str = "1"
+    PASSWORD_HASH_WORKERS: int = 4
+    PASSWORD_HASH_QUEUE_SIZE: int = 100
+    STATISTICS_REFRESH_SECONDS: int = 300
+    LOCAL_CACHE_MAX_SIZE: int = 32 * 1024 * 1024
+    TEMPLATES_BYTECODE_CACHE_DIR: str | None = None
+    TEMPLATES_PRECOMPILE: bool = False
+    TEMPLATES_AUTO_RELOAD: bool = True
+    CACHE_COMPRESSION: str = "zlib"
+    CACHE_COMPRESSION_THRESHOLD: int = 1024
+    WARMUP_PACKAGES: int = 100
+    WARMUP_CONCURRENCY: int = 4
+    JOB_BACKEND: Literal["memory", "redis"] = "memory"
+    JOB_QUEUE_SIZE: int = 1000
+    JOB_WORKERS: int = 2
+    JOB_SHUTDOWN_TIMEOUT: int = 10
+    JOB_STREAM: str = "jobs"
+    JOB_STREAM_GROUP: str = "workers"
+    JOB_STREAM_MAX_LENGTH: int = 100_000
+    JOB_BATCH_SIZE: int = 100
+    LOGIN_FLUSH_SECONDS: int = 10
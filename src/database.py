@@ -1,32 +1,138 @@
-from typing import Any
+import asyncio
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Awaitable
 
 from sqlalchemy import CursorResult, Insert, Select, Update
-from sqlalchemy.ext.asyncio import async_engine_from_config
+from sqlalchemy.ext.asyncio import AsyncConnection, async_engine_from_config
 
+from src.metrics import db_pool_checkout, instrument_engine
 from src.settings import db_settings
 
 engine = async_engine_from_config(db_settings.config)
+instrument_engine(engine.sync_engine)
+
+
+class RequestConnection:
+    """One pooled connection shared by the queries of a request.
+
+    The connection is checked out on the first query and returned to the pool
+    once the response starts, or before a long wait that needs no database
+    (see release_connection). A later query checks one out again. Every query
+    still runs in its own transaction.
+    """
+
+    def __init__(self):
+        self._conn: AsyncConnection | None = None
+        self._lock = asyncio.Lock()
+
+    @asynccontextmanager
+    async def begin(self) -> AsyncIterator[AsyncConnection]:
+        # a connection can't run queries concurrently, tasks take turns
+        async with self._lock:
+            if self._conn is None:
+                with db_pool_checkout.time():
+                    self._conn = await engine.connect()
+            async with self._conn.begin():
+                yield self._conn
+
+    async def close(self) -> None:
+        async with self._lock:
+            if self._conn is not None:
+                await self._conn.close()
+                self._conn = None
+
+
+_request_connection: ContextVar[RequestConnection | None] = ContextVar(
+    "request_connection", default=None
+)
+
+
+@asynccontextmanager
+async def request_connection() -> AsyncIterator[RequestConnection]:
+    request_conn = RequestConnection()
+    token = _request_connection.set(request_conn)
+    try:
+        yield request_conn
+    finally:
+        _request_connection.reset(token)
+        await request_conn.close()
+
+
+async def release_connection() -> None:
+    """Return the connection of the current request to the pool, e.g. while
+    the request waits for a password hash"""
+    if (request_conn := _request_connection.get()) is not None:
+        await request_conn.close()
+
+
+@asynccontextmanager
+async def begin() -> AsyncIterator[AsyncConnection]:
+    if (request_conn := _request_connection.get()) is None:
+        with db_pool_checkout.time():
+            conn = await engine.connect()
+        try:
+            async with conn.begin():
+                yield conn
+        finally:
+            await conn.close()
+    else:
+        async with request_conn.begin() as conn:
+            yield conn
+
+
+def dialect_name() -> str:
+    return engine.dialect.name
+
+
+async def detached(aw: Awaitable) -> Any:
+    """Run queries of aw on their own pooled connections.
+
+    Meant to be wrapped in a task (it gets a copied context), so the request
+    connection isn't used after the request or by several tasks at once.
+    """
+    _request_connection.set(None)
+    return await aw
+
+
+async def gather(*aws: Awaitable) -> list[Any]:
+    """Run independent queries concurrently, each on its own pooled connection"""
+    return await asyncio.gather(*(detached(aw) for aw in aws))
 
 
 async def fetch_one(select_query: Select | Insert | Update) -> dict[str, Any] | None:
-    async with engine.begin() as conn:
+    async with begin() as conn:
         cursor: CursorResult = await conn.execute(select_query)
         result = cursor.first()
         return result._asdict() if result else None
 
 
 async def fetch_all(select_query: Select | Insert | Update) -> list[dict[str, Any]]:
-    async with engine.begin() as conn:
+    async with begin() as conn:
         cursor: CursorResult = await conn.execute(select_query)
         return [r._asdict() for r in cursor.all()]
 
 
 async def execute(select_query: Insert | Update) -> None:
-    async with engine.begin() as conn:
+    async with begin() as conn:
         await conn.execute(select_query)
 
 
+async def execute_many(
+    *queries: tuple[Insert | Update, list[dict[str, Any]]],
+) -> int:
+    """Run several bulk statements in a single transaction, return the number
+    of parameter sets executed"""
+    rows = 0
+    async with begin() as conn:
+        for insert_query, values in queries:
+            if values:
+                await conn.execute(insert_query, values)
+                rows += len(values)
+    return rows
+
+
 async def fetch_scalar(select_query: Select) -> Any:
-    async with engine.begin() as conn:
+    async with begin() as conn:
         cursor: CursorResult = await conn.execute(select_query)
         return cursor.scalar()
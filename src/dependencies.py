@@ -1,31 +1,50 @@
+import functools
+import logging
 from datetime import datetime
 
+import jinja2
 from starlette.requests import Request
 from starlette.templating import Jinja2Templates
 
-from src.redis import get_by_key
-from src.utils import cookie_auth
+from src import sessions
+from src.settings import settings
+
+TEMPLATES_DIR = "src/templates"
+
+logger = logging.getLogger(__name__)
 
 
 def datetime_format(value: datetime, dt_format: str = "%d-%m-%y %H:%M"):
     return value.strftime(dt_format)
 
 
-def get_templates():
-    template = Jinja2Templates(directory="src/templates")
-    template.env.filters["datetimeformat"] = datetime_format
-    return template
+@functools.cache
+def get_templates() -> Jinja2Templates:
+    """Templates shared by every view, so each template is compiled once"""
+    env = jinja2.Environment(
+        loader=jinja2.FileSystemLoader(TEMPLATES_DIR),
+        autoescape=True,
+        auto_reload=settings.TEMPLATES_AUTO_RELOAD,
+        # compiled templates survive restarts and are shared between workers
+        bytecode_cache=jinja2.FileSystemBytecodeCache(
+            settings.TEMPLATES_BYTECODE_CACHE_DIR
+        ),
+    )
+    env.filters["datetimeformat"] = datetime_format
+    return Jinja2Templates(env=env)
 
 
-def get_user_id_from_cookie(request: Request):
-    return cookie_auth.get_user_id_via_auth_cookie(request)
+def precompile_templates() -> None:
+    env = get_templates().env
+    names = env.list_templates(extensions=["html"])
+    for name in names:
+        env.get_template(name)
+    logger.info("Precompiled %s templates", len(names))
 
 
-async def get_package_from_cache(package_name: str):
-    key = "package_" + package_name.strip()
-    return await get_by_key(key)
+async def get_user_id_from_cookie(request: Request) -> int | None:
+    return await sessions.get_user_id(request)
 
 
-async def get_search_from_cache(q: str):
-    key = "search_" + q.strip()
-    return await get_by_key(key)
+def package_cache_key(package_name: str) -> str:
+    return "package_" + package_name.strip()
@@ -0,0 +1,204 @@
+import asyncio
+import logging
+import socket
+from typing import Any, Awaitable, Callable, Hashable
+
+import orjson
+import redis.asyncio as aioredis
+from redis.exceptions import ResponseError
+
+from src import redis
+from src.metrics import CounterFunc, Gauge
+from src.settings import settings
+
+logger = logging.getLogger(__name__)
+
+Job = Callable[..., Awaitable[Any]]
+
+# jobs a separate worker process may run (see consume_stream), by name
+JOBS: dict[str, Job] = {}
+
+
+def register_job(func: Job) -> Job:
+    JOBS[func.__name__] = func
+    return func
+
+
+def is_registered(func: Job) -> bool:
+    return JOBS.get(func.__name__) is func
+
+
+class JobQueue:
+    """Bounded in-process queue of jobs run by a few worker tasks.
+
+    submit waits while the queue is full, so a burst slows its requests down
+    instead of piling up jobs. A job submitted with a key replaces a pending
+    job with the same key.
+    """
+
+    def __init__(self, max_size: int, workers: int, name: str):
+        self.name = name
+        self.workers = workers
+        self.completed = 0
+        self.failed = 0
+        self.coalesced = 0
+        self._queue: asyncio.Queue[Hashable] = asyncio.Queue(max_size)
+        self._pending: dict[Hashable, tuple[Job, tuple]] = {}
+        self._tasks: list[asyncio.Task] = []
+
+    async def submit(self, func: Job, *args: Any, key: Hashable | None = None) -> None:
+        if key is not None and key in self._pending:
+            self._pending[key] = (func, args)
+            self.coalesced += 1
+            return
+
+        token = key if key is not None else object()
+        self._pending[token] = (func, args)
+        await self._queue.put(token)
+
+    def start(self) -> None:
+        self._tasks = [
+            asyncio.create_task(self.work(), name=f"{self.name}-{i}")
+            for i in range(self.workers)
+        ]
+
+    async def work(self) -> None:
+        while True:
+            token = await self._queue.get()
+            func, args = self._pending.pop(token)
+            try:
+                await func(*args)
+            except Exception:
+                self.failed += 1
+                logger.exception("Job %s failed", func.__qualname__)
+            else:
+                self.completed += 1
+            finally:
+                self._queue.task_done()
+
+    async def stop(self, timeout: float) -> None:
+        """Finish queued jobs (for at most timeout seconds) and stop"""
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except TimeoutError:
+            logger.warning("%s jobs lost on shutdown", self._queue.qsize())
+        for task in self._tasks:
+            task.cancel()
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+
+class RedisStreamJobQueue(JobQueue):
+    """Sends registered jobs to a redis stream instead, where they survive a
+    crash of the web worker and are run by `python -m src.jobs`.
+
+    Other jobs, like cache writes that also fill the local cache of this
+    worker, still run in process.
+    """
+
+    def __init__(self, stream: str, max_size: int, workers: int, name: str):
+        super().__init__(max_size, workers, name)
+        self.stream = stream
+
+    async def submit(self, func: Job, *args: Any, key: Hashable | None = None) -> None:
+        if not is_registered(func):
+            return await super().submit(func, *args, key=key)
+        await self.send({"job": func.__name__, "args": orjson.dumps(args)})
+
+    async def send(self, fields: dict[str, Any]) -> None:
+        await redis.redis_client.xadd(
+            self.stream, fields, maxlen=settings.JOB_STREAM_MAX_LENGTH
+        )
+
+
+def create_job_queue() -> JobQueue:
+    if settings.JOB_BACKEND == "redis":
+        return RedisStreamJobQueue(
+            settings.JOB_STREAM, settings.JOB_QUEUE_SIZE, settings.JOB_WORKERS, "jobs"
+        )
+    return JobQueue(settings.JOB_QUEUE_SIZE, settings.JOB_WORKERS, "jobs")
+
+
+job_queue = create_job_queue()
+Gauge("job_queue_depth", "Jobs waiting to run", lambda: job_queue.queue_depth)
+CounterFunc("jobs_completed_total", "Jobs run", lambda: job_queue.completed)
+CounterFunc("jobs_failed_total", "Jobs that raised", lambda: job_queue.failed)
+CounterFunc(
+    "jobs_coalesced_total",
+    "Jobs replaced by a later one with the same key",
+    lambda: job_queue.coalesced,
+)
+
+
+async def run_job(func: Job, *args: Any) -> bool:
+    try:
+        await func(*args)
+    except Exception:
+        logger.exception("Job %s failed", func.__qualname__)
+        return False
+    return True
+
+
+async def run_messages(messages: list[tuple[bytes, dict[bytes, bytes]]]) -> list:
+    """Run jobs of stream messages.
+
+    Returns ids of the messages handled, failed ones stay pending.
+    """
+    handled = []
+    for message_id, fields in messages:
+        func = JOBS[fields[b"job"].decode()]
+        if await run_job(func, *orjson.loads(fields[b"args"])):
+            handled.append(message_id)
+    return handled
+
+
+async def create_group(stream: str, group: str) -> None:
+    try:
+        await redis.redis_client.xgroup_create(stream, group, id="0", mkstream=True)
+    except ResponseError as er:
+        if "BUSYGROUP" not in str(er):
+            raise
+
+
+async def consume_stream(stream: str, group: str, batch_size: int) -> None:
+    """Run jobs sent to stream, together with other consumers of group"""
+    consumer = socket.gethostname()
+    await create_group(stream, group)
+
+    # messages this consumer read before a crash (or failed) first, once,
+    # then new ones
+    pending_after: bytes | None = b"0"
+    while True:
+        response = await redis.redis_client.xreadgroup(
+            group,
+            consumer,
+            {stream: pending_after or ">"},
+            count=batch_size,
+            block=5000,
+        )
+        messages = response[0][1] if response else []
+        if pending_after is not None:
+            pending_after = messages[-1][0] if messages else None
+        if handled := await run_messages(messages):
+            await redis.redis_client.xack(stream, group, *handled)
+
+
+async def main() -> None:
+    # registers the jobs this process runs
+    from src.services import user_service  # noqa: F401
+
+    pool = aioredis.ConnectionPool.from_url(str(settings.REDIS_URL))
+    redis.redis_client = aioredis.Redis(connection_pool=pool)
+    try:
+        await consume_stream(
+            settings.JOB_STREAM, settings.JOB_STREAM_GROUP, settings.JOB_BATCH_SIZE
+        )
+    finally:
+        await pool.disconnect()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
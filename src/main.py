@@ -1,3 +1,4 @@
+import asyncio
 from contextlib import asynccontextmanager
 from typing import AsyncGenerator
 
@@ -7,10 +8,17 @@ from fastapi import FastAPI
 from starlette.middleware.cors import CORSMiddleware
 from starlette.staticfiles import StaticFiles
 
-from src import redis
+from src import cache, redis
+from src.dependencies import precompile_templates
 from src.exception_handlers import register_error_handlers
+from src.jobs import job_queue
+from src.middleware import DBConnectionMiddleware, MetricsMiddleware
+from src.services import aggr_service, user_service
 from src.settings import settings
-from src.views import account, auth, home, package, search
+from src.tasks import once_per_interval, run_periodically
+from src.utils.security import password_executor
+from src.views import account, auth, home, metrics, package, search
+from src.warmup import warm_up_cache
 
 REDIS_URL = str(settings.REDIS_URL)
 
@@ -20,11 +28,35 @@ async def lifespan(_application: FastAPI) -> AsyncGenerator:
     pool = aioredis.ConnectionPool.from_url(
         REDIS_URL,
         max_connections=10,
-        decode_responses=True,
+        # cached values are binary (see redis.CacheCodec)
+        decode_responses=False,
     )
     redis.redis_client = aioredis.Redis(connection_pool=pool)
+    if settings.TEMPLATES_PRECOMPILE:
+        precompile_templates()
+    invalidation_task = asyncio.create_task(cache.listen_invalidations())
+    # full table counts, one worker reconciles them for all
+    refresh_statistics = once_per_interval(
+        aggr_service.refresh_count_statistics, settings.STATISTICS_REFRESH_SECONDS
+    )
+    statistics_task = asyncio.create_task(
+        run_periodically(refresh_statistics, settings.STATISTICS_REFRESH_SECONDS)
+    )
+    job_queue.start()
+    login_flush_task = asyncio.create_task(
+        run_periodically(user_service.flush_login_times, settings.LOGIN_FLUSH_SECONDS)
+    )
+    # runs while the worker already serves requests
+    warmup_task = asyncio.create_task(warm_up_cache())
     yield
+    login_flush_task.cancel()
+    await user_service.flush_login_times()
+    await job_queue.stop(settings.JOB_SHUTDOWN_TIMEOUT)
+    warmup_task.cancel()
+    statistics_task.cancel()
+    invalidation_task.cancel()
     await pool.disconnect()
+    password_executor.shutdown()
 
 
 app = FastAPI(lifespan=lifespan)
@@ -37,6 +69,9 @@ app.add_middleware(
     allow_methods=("GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"),
     allow_headers=settings.CORS_HEADERS,
 )
+app.add_middleware(DBConnectionMiddleware)
+# outermost, the latency includes the other middlewares
+app.add_middleware(MetricsMiddleware)
 
 app.mount("/static", StaticFiles(directory="src/static"), name="static")
 app.include_router(home.router)
@@ -44,6 +79,7 @@ app.include_router(package.router)
 app.include_router(account.router)
 app.include_router(search.router)
 app.include_router(auth.router)
+app.include_router(metrics.router)
 
 register_error_handlers(app=app)
 
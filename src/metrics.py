@@ -0,0 +1,214 @@
+import bisect
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Iterator
+
+from sqlalchemy import event
+
+# seconds, from a local cache hit to a slow page
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def format_labels(names: tuple[str, ...], values: tuple[Any, ...]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{v}"' for n, v in zip(names, values, strict=True))
+    return "{" + pairs + "}"
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        REGISTRY.append(self)
+
+    def samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        header = (
+            f"# HELP {self.name} {self.help_text}\n# TYPE {self.name} {self.kind}\n"
+        )
+        return header + "".join(f"{sample}\n" for sample in self.samples())
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: tuple[str, ...] = ()):
+        super().__init__(name, help_text, labels)
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, *labels: Any, amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self) -> Iterator[str]:
+        for labels, value in self.values.items():
+            yield f"{self.name}{format_labels(self.labels, labels)} {value}"
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, help_text, labels)
+        self.buckets = buckets
+        # per labels: count of each bucket (not cumulative), sum, count
+        self.values: dict[tuple, tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, *labels: Any) -> None:
+        if (entry := self.values.get(labels)) is None:
+            entry = self.values[labels] = ([0] * len(self.buckets), [0.0, 0])
+        buckets, totals = entry
+        if (i := bisect.bisect_left(self.buckets, value)) < len(buckets):
+            buckets[i] += 1
+        totals[0] += value
+        totals[1] += 1
+
+    @contextmanager
+    def time(self, *labels: Any) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def samples(self) -> Iterator[str]:
+        names = (*self.labels, "le")
+        for labels, (buckets, (total, count)) in self.values.items():
+            cumulative = 0
+            for bound, bucket in zip(self.buckets, buckets, strict=True):
+                cumulative += bucket
+                le = format_labels(names, (*labels, bound))
+                yield f"{self.name}_bucket{le} {cumulative}"
+            yield f"{self.name}_bucket{format_labels(names, (*labels, '+Inf'))} {count}"
+            label_text = format_labels(self.labels, labels)
+            yield f"{self.name}_sum{label_text} {total}"
+            yield f"{self.name}_count{label_text} {count}"
+
+
+class Gauge(Metric):
+    """Current value, or the result of func (e.g. a queue depth) read when
+    metrics are collected."""
+
+    kind = "gauge"
+
+    def __init__(
+        self, name: str, help_text: str, func: Callable[[], float] | None = None
+    ):
+        super().__init__(name, help_text)
+        self.value = 0.0
+        self.func = func
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+    def samples(self) -> Iterator[str]:
+        yield f"{self.name} {self.func() if self.func else self.value}"
+
+
+class CounterFunc(Gauge):
+    """Total kept elsewhere (e.g. jobs run by a queue), read when metrics are
+    collected."""
+
+    kind = "counter"
+
+
+REGISTRY: list[Metric] = []
+
+
+def render_metrics() -> str:
+    """Prometheus text format (of this worker process)"""
+    return "".join(metric.render() for metric in REGISTRY)
+
+
+http_request_duration = Histogram(
+    "http_request_duration_seconds",
+    "Time to handle a request, until the last byte of the response is sent",
+    ("method", "route", "status"),
+)
+db_queries = Histogram(
+    "db_queries_per_request", "Database queries run by a request", buckets=COUNT_BUCKETS
+)
+db_request_time = Histogram(
+    "db_request_time_seconds", "Time a request spent waiting for query results"
+)
+db_query_duration = Histogram("db_query_duration_seconds", "Time of a database query")
+db_pool_checkout = Histogram(
+    "db_pool_checkout_seconds", "Time to get a connection from the pool"
+)
+db_pool_checked_out = Gauge("db_pool_checked_out", "Connections in use")
+redis_command_duration = Histogram(
+    "redis_command_duration_seconds", "Time of a redis read", ("command",)
+)
+cache_requests = Counter(
+    "cache_requests_total", "Cache lookups by result", ("cache", "result")
+)
+template_render_duration = Histogram(
+    "template_render_seconds", "Time spent rendering a page template", ("template",)
+)
+
+
+class RequestStats:
+    __slots__ = ("queries", "query_time")
+
+    def __init__(self):
+        self.queries = 0
+        self.query_time = 0.0
+
+
+# queries of the current request, shared with the tasks it starts
+_request_stats: ContextVar[RequestStats | None] = ContextVar(
+    "request_stats", default=None
+)
+
+
+def instrument_pool(pool: Any) -> None:
+    """Count the connections checked out of pool"""
+
+    @event.listens_for(pool, "checkout")
+    def checkout(dbapi_connection, connection_record, connection_proxy):
+        db_pool_checked_out.inc()
+
+    @event.listens_for(pool, "checkin")
+    def checkin(dbapi_connection, connection_record):
+        db_pool_checked_out.inc(-1)
+
+
+def instrument_engine(engine: Any) -> None:
+    """Time every query run through engine (a sync Engine)"""
+    instrument_pool(engine.pool)
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_execute(conn, cursor, statement, parameters, context, executemany):
+        context._query_started = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._query_started
+        db_query_duration.observe(elapsed)
+        if (stats := _request_stats.get()) is not None:
+            stats.queries += 1
+            stats.query_time += elapsed
+
+
+@contextmanager
+def request_stats() -> Iterator[RequestStats]:
+    """Count queries run in this context (and the tasks it starts)"""
+    stats = RequestStats()
+    token = _request_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _request_stats.reset(token)
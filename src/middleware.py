@@ -0,0 +1,67 @@
+import time
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.database import request_connection
+from src.metrics import (
+    db_queries,
+    db_request_time,
+    http_request_duration,
+    request_stats,
+)
+
+
+class DBConnectionMiddleware:
+    """Run the queries of an HTTP request on a single pooled connection,
+    returned to the pool as soon as the response starts."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async with request_connection() as request_conn:
+
+            async def send_releasing(message: Message) -> None:
+                # the endpoint is done, don't hold the connection while the
+                # body is streamed to the client
+                if message["type"] == "http.response.start":
+                    await request_conn.close()
+                await send(message)
+
+            await self.app(scope, receive, send_releasing)
+
+
+class MetricsMiddleware:
+    """Record latency and database usage of every HTTP request"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        with request_stats() as stats:
+            try:
+                await self.app(scope, receive, send_with_status)
+            finally:
+                # the route template, raw paths would explode the label values
+                route = getattr(scope.get("route"), "path", "other")
+                elapsed = time.perf_counter() - started
+                http_request_duration.observe(elapsed, scope["method"], route, status)
+                db_queries.observe(stats.queries)
+                db_request_time.observe(stats.query_time)
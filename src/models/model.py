@@ -4,11 +4,13 @@ from sqlalchemy import (
     DateTime,
     ForeignKey,
     Identity,
+    Index,
     Integer,
     MetaData,
     String,
     Table,
     func,
+    text,
 )
 
 DB_NAMING_CONVENTION = {
@@ -21,6 +23,12 @@ DB_NAMING_CONVENTION = {
 
 metadata = MetaData(naming_convention=DB_NAMING_CONVENTION)
 
+# postgres only schema created by migrations and left out of the tables below,
+# so other databases and `select(package)` don't see it (alembic autogenerate
+# skips it): the full text search document of a package, a generated tsvector
+# column weighted name > summary > description, and its GIN index
+MIGRATION_ONLY_SCHEMA = {"search_document", "ix_package_search_document"}
+
 user = Table(
     "user",
     metadata,
@@ -49,6 +57,11 @@ package = Table(
     Column("author_name", String),
     Column("author_email", String, index=True, nullable=False),
     Column("license", String, nullable=True),
+    # denormalized max(release.create_at), kept by a db trigger on release
+    Column("latest_release_at", DateTime, index=True),
+    Index("ix_package_id_lower", text("lower(id) text_pattern_ops")).ddl_if(
+        dialect="postgresql"
+    ),
 )
 
 release = Table(
@@ -65,6 +78,15 @@ release = Table(
     Column("url", String),
     Column("size", BigInteger),
     Column("package_id", String, ForeignKey("package.id", ondelete="CASCADE")),
+    Index("ix_release_package_id_create_at", "package_id", text("create_at DESC")),
+)
+
+site_statistics = Table(
+    "site_statistics",
+    metadata,
+    Column("name", String, primary_key=True),
+    Column("value", BigInteger, server_default="0", nullable=False),
+    Column("update_at", DateTime, server_default=func.now(), onupdate=func.now()),
 )
 
 maintainer = Table(
@@ -25,15 +25,17 @@ class CustomModel(BaseModel):
 
     @model_validator(mode="before")
     @classmethod
-    def set_null_microseconds(cls, data: dict[str, Any]) -> dict[str, Any]:
+    def set_null_microseconds(cls, data: Any) -> Any:
         """Remove microseconds from datetime object"""
+        if not isinstance(data, dict):
+            return data
         datetime_fields = {
             k: v.replace(microsecond=0)
             for k, v in data.items()
-            if isinstance(v, datetime)
+            if isinstance(v, datetime) and v.microsecond
         }
-
-        return {**data, **datetime_fields}
+        # most rows have nothing to change, don't copy them
+        return {**data, **datetime_fields} if datetime_fields else data
 
 
 class Package(CustomModel):
@@ -63,16 +65,19 @@ class Release(CustomModel):
     package_id: str
 
 
-class User(CustomModel):
+class UserProfile(CustomModel):
     id: PositiveInt
     name: str
     email: EmailStr
-    hash_password: SecretStr
     create_at: datetime
     login_at: datetime | None = None
     profile_image_url: HttpUrl | None = None
 
 
+class User(UserProfile):
+    hash_password: SecretStr
+
+
 class ViewModelBase(CustomModel):
     user_id: int | None = Field(default=None)
 
@@ -81,6 +86,14 @@ class ViewModelBase(CustomModel):
     def is_logged_in(self) -> bool:
         return self.user_id is not None
 
+    def template_context(self) -> dict[str, Any]:
+        """Fields for a template without model_dump() copying nested models,
+        templates read them by attribute all the same"""
+        return {
+            **dict(self),
+            **{name: getattr(self, name) for name in self.model_computed_fields},
+        }
+
 
 class HomePageView(ViewModelBase):
     release_count: int = Field(default=0)
@@ -89,8 +102,30 @@ class HomePageView(ViewModelBase):
     packages: list[Package | None] = Field(default_factory=list)
 
 
-class SearchPageView(ViewModelBase):
-    packages: list[Package | None] = Field(default_factory=list)
+class SearchApiHit(CustomModel):
+    id: str
+    summary: str
+    create_at: datetime
+    rank: int
+
+
+class SearchHit(SearchApiHit):
+    # words of the package starting with a one word query, lets the cached
+    # result answer longer queries (see search_service.find_prefix_page)
+    terms: list[str] = Field(default_factory=list)
+
+
+class SearchApiPage(CustomModel):
+    packages: list[SearchApiHit] = Field(default_factory=list)
+    next_cursor: str | None = Field(default=None)
+
+
+class SearchResultPage(SearchApiPage):
+    packages: list[SearchHit] = Field(default_factory=list)
+
+
+class SearchPageView(ViewModelBase, SearchResultPage):
+    pass
 
 
 class DetailPackageView(ViewModelBase):
@@ -112,7 +147,7 @@ class DetailPackageView(ViewModelBase):
 
 
 class AccountPageView(ViewModelBase):
-    user: User | None = Field(default=None)
+    user: UserProfile | None = Field(default=None)
 
 
 class LoginForm(BaseModel):
@@ -1,30 +1,169 @@
+import zlib
 from datetime import timedelta
-from typing import Optional
+from typing import Callable, NamedTuple, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from redis.asyncio import Redis
+from redis.asyncio.client import Pipeline
+
+from src.metrics import redis_command_duration
+from src.settings import settings
 
 redis_client: Redis = None  # type: ignore
 
+# bump when the layout of cached values changes, older values become misses
+CODEC_VERSION = 1
+
+
+class Compressor(NamedTuple):
+    # stored in every value, so values stay readable after switching
+    tag: int
+    compress: Callable[[bytes], bytes]
+    decompress: Callable[[bytes], bytes]
+
+
+COMPRESSORS: dict[str, Compressor] = {
+    "none": Compressor(0, bytes, bytes),
+    "zlib": Compressor(1, zlib.compress, zlib.decompress),
+}
+
+try:
+    import zstandard
+except ImportError:
+    pass
+else:
+    COMPRESSORS["zstd"] = Compressor(
+        2,
+        zstandard.ZstdCompressor().compress,
+        zstandard.ZstdDecompressor().decompress,
+    )
+
+try:
+    import lz4.frame
+except ImportError:
+    pass
+else:
+    COMPRESSORS["lz4"] = Compressor(3, lz4.frame.compress, lz4.frame.decompress)
+
+
+class CacheCodec:
+    """Binary layout of cached values: version, compressor tag, payload.
+
+    Payloads shorter than threshold aren't worth compressing and are
+    stored as they are.
+    """
+
+    def __init__(self, compression: str, threshold: int):
+        if compression not in COMPRESSORS:
+            raise ValueError(
+                f"Unsupported cache compression {compression!r}, "
+                f"available: {', '.join(COMPRESSORS)}"
+            )
+        self.compressor = COMPRESSORS[compression]
+        self.threshold = threshold
+        self.decompressors = {c.tag: c.decompress for c in COMPRESSORS.values()}
+
+    def encode(self, payload: bytes) -> bytes:
+        compressor = COMPRESSORS["none"]
+        if len(payload) >= self.threshold:
+            compressor = self.compressor
+        header = bytes((CODEC_VERSION, compressor.tag))
+        return header + compressor.compress(payload)
+
+    def decode(self, data: bytes) -> bytes | None:
+        """Payload of data, None if it was written in another format"""
+        if len(data) < 2 or data[0] != CODEC_VERSION:
+            return None
+        if (decompress := self.decompressors.get(data[1])) is None:
+            return None
+        return decompress(data[2:])
+
+
+cache_codec = CacheCodec(
+    settings.CACHE_COMPRESSION, settings.CACHE_COMPRESSION_THRESHOLD
+)
+
 
 class RedisData(BaseModel):
     key: bytes | str
     value: bytes | str
     ttl: Optional[int | timedelta] = None
+    # groups of keys deleted together, see delete_by_tag
+    tags: list[str] = Field(default_factory=list)
+
+
+def tag_key(tag: str) -> str:
+    return f"tag:{tag}"
+
+
+def add_set_commands(pipe: Pipeline, redis_data: RedisData) -> None:
+    # SET EX, a single command for value and expiry
+    pipe.set(redis_data.key, redis_data.value, ex=redis_data.ttl)
+    for tag in redis_data.tags:
+        pipe.sadd(tag_key(tag), redis_data.key)
+        # the tag outlives its newest key, older members may already be gone
+        if redis_data.ttl:
+            pipe.expire(tag_key(tag), redis_data.ttl)
 
 
 async def set_redis_key(redis_data: RedisData, *, is_transaction: bool = False) -> None:
+    if not redis_data.tags:
+        await redis_client.set(redis_data.key, redis_data.value, ex=redis_data.ttl)
+        return
+
     async with redis_client.pipeline(transaction=is_transaction) as pipe:
-        await pipe.set(redis_data.key, redis_data.value)
-        if redis_data.ttl:
-            await pipe.expire(redis_data.key, redis_data.ttl)
+        add_set_commands(pipe, redis_data)
+        await pipe.execute()
 
+
+async def set_redis_keys(
+    redis_data: list[RedisData], *, is_transaction: bool = False
+) -> None:
+    """Set many keys, each with its own ttl and tags, in one round trip"""
+    if not redis_data:
+        return
+    async with redis_client.pipeline(transaction=is_transaction) as pipe:
+        for data in redis_data:
+            add_set_commands(pipe, data)
         await pipe.execute()
 
 
-async def get_by_key(key: str) -> str | None:
-    return await redis_client.get(key)
+async def get_by_key(key: str) -> bytes | None:
+    with redis_command_duration.time("get"):
+        return await redis_client.get(key)
+
+
+async def get_by_keys(keys: list[str]) -> list[bytes | None]:
+    if not keys:
+        return []
+    with redis_command_duration.time("mget"):
+        return await redis_client.mget(keys)
+
+
+async def get_with_ttl(keys: list[str]) -> list[tuple[bytes | None, int]]:
+    """Values of keys with their remaining ttl in milliseconds, one round trip"""
+    with redis_command_duration.time("get_with_ttl"):
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.get(key).pttl(key)
+            results = await pipe.execute()
+    return list(zip(results[::2], results[1::2], strict=True))
 
 
 async def delete_by_key(key: str) -> None:
     return await redis_client.delete(key)
+
+
+async def delete_by_keys(keys: list[str]) -> int:
+    if not keys:
+        return 0
+    return await redis_client.delete(*keys)
+
+
+async def delete_by_tag(tag: str) -> list[str]:
+    """Delete every key tagged with tag, returns the deleted keys"""
+    async with redis_client.pipeline(transaction=True) as pipe:
+        members, _ = await pipe.smembers(tag_key(tag)).delete(tag_key(tag)).execute()
+    keys = [key.decode() if isinstance(key, bytes) else key for key in members]
+    await delete_by_keys(keys)
+    return keys
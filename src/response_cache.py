@@ -0,0 +1,153 @@
+import hashlib
+import json
+import math
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterator, NamedTuple
+
+from starlette.concurrency import iterate_in_threadpool
+from starlette.requests import Request
+from starlette.responses import HTMLResponse, Response, StreamingResponse
+
+from src import cache
+from src.dependencies import get_templates
+from src.jobs import job_queue
+from src.metrics import template_render_duration
+
+# rendered parts are sent in chunks of at least this many characters
+STREAM_CHUNK_SIZE = 16 * 1024
+# the end of the document head is sent as soon as it is rendered
+HEAD_END = "</head>"
+
+
+class CachedPage(NamedTuple):
+    body: bytes
+    etag: str
+
+
+class PageTemplate(NamedTuple):
+    name: str
+    context: dict[str, Any]
+
+
+def dump_page(page: CachedPage) -> bytes:
+    return page.etag.encode() + b"\n" + page.body
+
+
+def load_page(data: bytes) -> CachedPage:
+    etag, _, body = data.partition(b"\n")
+    return CachedPage(body, etag.decode())
+
+
+def make_etag(body: bytes) -> str:
+    return '"{}"'.format(hashlib.blake2b(body, digest_size=16).hexdigest())
+
+
+def response_cache_key(
+    request: Request, user_id: int | None, params: dict[str, Any] | None = None
+) -> str:
+    """Rendered pages only differ by the login state of the user and the
+    (parsed) query parameters the view reads. Other parameters are ignored,
+    so they can't be used to fill the cache with copies of a page."""
+    user_state = "anonymous" if user_id is None else "user"
+    query = sorted((params or {}).items())
+    return f"page_{user_state}_{request.url.path}_{json.dumps(query)}"
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # weak comparison, as required for If-None-Match
+    return etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+
+
+def generate_chunks(request: Request, page: PageTemplate) -> Iterator[bytes]:
+    """Render page part by part, joined into chunks of STREAM_CHUNK_SIZE.
+
+    The head goes out in the first chunk without waiting for the body, so
+    the browser starts fetching styles and scripts while the rest renders.
+    """
+    template = get_templates().get_template(page.name)
+    parts, size, head_sent = [], 0, False
+    # time spent rendering, without the time chunks wait to be sent
+    render_time, started = 0.0, time.perf_counter()
+    for part in template.generate({"request": request, **page.context}):
+        parts.append(part)
+        size += len(part)
+        if size >= STREAM_CHUNK_SIZE or (not head_sent and HEAD_END in part):
+            head_sent = head_sent or HEAD_END in part
+            chunk = "".join(parts).encode()
+            render_time += time.perf_counter() - started
+            yield chunk
+            started = time.perf_counter()
+            parts, size = [], 0
+    chunk = "".join(parts).encode()
+    template_render_duration.observe(
+        render_time + time.perf_counter() - started, page.name
+    )
+    if chunk:
+        yield chunk
+
+
+async def stream_and_store(
+    key: str, chunks: Iterator[bytes], ttl: int, tags: list[str] | None
+) -> AsyncIterator[bytes]:
+    body = []
+    # rendering is cpu bound, keep it off the event loop
+    async for chunk in iterate_in_threadpool(chunks):
+        body.append(chunk)
+        yield chunk
+    body = b"".join(body)
+    page = CachedPage(body, make_etag(body))
+    # concurrent misses of a page are stored once
+    await job_queue.submit(
+        cache.set_cached, key, page, dump_page, ttl, 0.0, tags, key=f"cache:{key}"
+    )
+
+
+def page_headers(user_id: int | None, max_age: int) -> dict[str, str]:
+    return {
+        # cached per login state, shared caches must not mix them up
+        "Cache-Control": (
+            f"public, max-age={max_age}" if user_id is None else "private, no-cache"
+        ),
+        "Vary": "Cookie",
+    }
+
+
+async def cached_response(
+    request: Request,
+    user_id: int | None,
+    render: Callable[[], Awaitable[PageTemplate]],
+    ttl: int | Callable[[PageTemplate], int],
+    tags: list[str] | None = None,
+    params: dict[str, Any] | None = None,
+) -> Response:
+    """Rendered page of the request, served from the cache when possible.
+
+    A cached page is answered with its ETag, or 304 Not Modified if it
+    matches If-None-Match. Otherwise the page is streamed while it renders
+    and stored once complete. Views signal errors by raising, so only
+    successful renders are stored. ttl may depend on the rendered page.
+    """
+    key = response_cache_key(request, user_id, params)
+    entry = await cache.lookup(key, load_page)
+    if entry is None:
+        page = await render()
+        ttl = ttl(page) if callable(ttl) else ttl
+        return StreamingResponse(
+            stream_and_store(key, generate_chunks(request, page), ttl, tags),
+            media_type="text/html",
+            headers=page_headers(user_id, ttl),
+        )
+
+    # clients keep the page no longer than the cache does
+    remaining = entry.expires_at - time.monotonic()
+    max_age = max(int(remaining), 0) if remaining < math.inf else 0
+    headers = page_headers(user_id, max_age)
+    headers["ETag"] = entry.value.etag
+    if etag_matches(request, entry.value.etag):
+        return Response(status_code=304, headers=headers)
+    return HTMLResponse(entry.value.body, headers=headers)
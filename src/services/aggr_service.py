@@ -1,35 +1,63 @@
 from typing import Any
 
-from sqlalchemy import Table, func, select
+from sqlalchemy import ScalarSelect, Table, func, select, update
 
-from src.database import fetch_scalar
-from src.models.model import package, release, user
+from src.database import execute, fetch_all, fetch_one, gather
+from src.models.model import package, release, site_statistics, user
 from src.services import package_service
 
 
-async def get_count(table: Table) -> int | None:
-    select_query = select(func.count(table.c.id))
-    return await fetch_scalar(select_query)
+def count_subquery(table: Table) -> ScalarSelect:
+    return select(func.count(table.c.id)).scalar_subquery()
+
+
+COUNTED_TABLES = {
+    "release_count": release,
+    "user_count": user,
+    "package_count": package,
+}
 
 
 async def get_count_statistics() -> dict[str, Any]:
-    return {
-        "release_count": await get_count(release),
-        "user_count": await get_count(user),
-        "package_count": await get_count(package),
-    }
+    """Counters kept up to date by db triggers (see site_statistics table)"""
+    select_query = select(site_statistics.c.name, site_statistics.c.value)
+    stats = {s["name"]: s["value"] for s in await fetch_all(select_query)}
+    if stats.keys() >= COUNTED_TABLES.keys():
+        return stats
+    return await get_exact_count_statistics()
+
+
+async def get_exact_count_statistics() -> dict[str, Any]:
+    select_query = select(
+        *(count_subquery(t).label(name) for name, t in COUNTED_TABLES.items())
+    )
+    return await fetch_one(select_query)
+
+
+async def refresh_count_statistics() -> None:
+    """Reconcile the counters with real table sizes (truncates, drift, ...)"""
+    for name, table in COUNTED_TABLES.items():
+        update_query = (
+            update(site_statistics)
+            .where(site_statistics.c.name == name)
+            .values(value=count_subquery(table))
+        )
+        await execute(update_query)
 
 
 async def get_package_details(package_name) -> dict[str, Any]:
+    package_data, latest_release, maintainers = await gather(
+        package_service.get_package_by_id(package_name),
+        package_service.get_latest_release_for_package(package_name),
+        package_service.get_maintainers_by_id(package_name),
+    )
     data = {
-        "package": await package_service.get_package_by_id(package_name),
-        "latest_release": await package_service.get_latest_release_for_package(
-            package_name,
-        ),
+        "package": package_data,
+        "latest_release": latest_release,
         "maintainers": [],
     }
 
-    if maintainers := await package_service.get_maintainers_by_id(package_name):
+    if maintainers:
         data["maintainers"].append(maintainers)
 
     return data
@@ -8,8 +8,9 @@ from src.models.model import maintainer, package, release
 
 async def latest_packages(limit: int = 5) -> list[dict[str, Any]]:
     select_query = (
-        (select(package).join(release, release.c.package_id == package.c.id))
-        .order_by(release.c.create_at.desc())
+        select(package.c.id, package.c.summary, package.c.create_at)
+        .filter(package.c.latest_release_at.isnot(None))
+        .order_by(package.c.latest_release_at.desc())
         .limit(limit)
     )
     return await fetch_all(select_query)
@@ -20,15 +21,13 @@ async def get_package_by_id(package_name: str) -> dict[str, Any]:
     return await fetch_one(select_query)
 
 
-async def search_packages_by_id(package_name: str) -> list[dict[str, Any]] | None:
-    select_query = select(package).filter(package.c.id.ilike(f"{package_name}%"))
-    return await fetch_all(select_query)
-
-
 async def get_latest_release_for_package(package_name: str) -> dict[str, Any]:
     select_query = (
-        select(release).join(package, package.c.id == package_name)
-    ).order_by(release.c.create_at.desc())
+        select(release)
+        .filter(release.c.package_id == package_name)
+        .order_by(release.c.create_at.desc())
+        .limit(1)
+    )
     return await fetch_one(select_query)
 
 
@@ -0,0 +1,119 @@
+import bisect
+import re
+from collections import defaultdict
+from typing import Any, Iterable
+
+WORD_PATTERN = re.compile(r"[^\W_]+")
+MAX_TERMS = 5
+
+
+class SearchRank:
+    EXACT_NAME = 0
+    NAME_PREFIX = 1
+    NAME_OR_SUMMARY = 2
+    DESCRIPTION = 3
+
+
+def normalize_query(q: str) -> str:
+    return " ".join(q.lower().split())
+
+
+def query_terms(q: str) -> list[str]:
+    return WORD_PATTERN.findall(q.lower())[:MAX_TERMS]
+
+
+def tokenize(text: str | None) -> set[str]:
+    return set(WORD_PATTERN.findall(text.lower())) if text else set()
+
+
+def rank_package(
+    package_id: str, head_tokens: set[str], q: str, terms: list[str]
+) -> int:
+    """head_tokens: words of the package name and summary"""
+    name = package_id.lower()
+    if name == q:
+        return SearchRank.EXACT_NAME
+    if name.startswith(q):
+        return SearchRank.NAME_PREFIX
+    if terms and all(
+        any(token.startswith(term) for token in head_tokens) for term in terms
+    ):
+        return SearchRank.NAME_OR_SUMMARY
+    return SearchRank.DESCRIPTION
+
+
+def prefix_range(keys: list, prefix: str) -> slice:
+    """Slice of a sorted list of strings starting with prefix"""
+    return slice(
+        bisect.bisect_left(keys, prefix),
+        bisect.bisect_left(keys, prefix + "\U0010ffff"),
+    )
+
+
+class SearchIndex:
+    """In-process inverted index over package id, summary and description.
+
+    Fallback for databases without full text search (SQLite, tests), matches,
+    ranks and pages results like the postgres query in search_service.
+    """
+
+    def __init__(self, packages: Iterable[dict[str, Any]]):
+        self._packages: dict[str, dict[str, Any]] = {}
+        self._head_tokens: dict[str, set[str]] = {}
+        self._postings: dict[str, set[str]] = defaultdict(set)
+        for p in packages:
+            package_id = p["id"]
+            self._packages[package_id] = {
+                "id": package_id,
+                "summary": p["summary"],
+                "create_at": p["create_at"],
+            }
+            head_tokens = tokenize(package_id) | tokenize(p["summary"])
+            self._head_tokens[package_id] = head_tokens
+            for token in head_tokens | tokenize(p.get("description")):
+                self._postings[token].add(package_id)
+
+        self._names = sorted(self._packages, key=str.lower)
+        self._lower_names = [name.lower() for name in self._names]
+        self._tokens = sorted(self._postings)
+
+    def search(
+        self,
+        q: str,
+        limit: int,
+        after: tuple[int, str] | None = None,
+        with_terms: bool = False,
+    ) -> list[dict[str, Any]]:
+        q = normalize_query(q)
+        terms = query_terms(q)
+        found = set(self._names[prefix_range(self._lower_names, q)])
+        if terms:
+            found |= set.intersection(*(self._term_matches(t) for t in terms))
+
+        hits = sorted(
+            (
+                rank_package(package_id, self._head_tokens[package_id], q, terms),
+                package_id,
+            )
+            for package_id in found
+        )
+        if after:
+            hits = hits[bisect.bisect_right(hits, tuple(after)) :]
+        results = [{**self._packages[i], "rank": rank} for rank, i in hits[:limit]]
+        if with_terms:
+            for result in results:
+                result["terms"] = self._document_terms(result["id"], q)
+        return results
+
+    def _document_terms(self, package_id: str, prefix: str) -> list[str]:
+        return [
+            token
+            for token in self._tokens[prefix_range(self._tokens, prefix)]
+            if package_id in self._postings[token]
+        ]
+
+    def _term_matches(self, term: str) -> set[str]:
+        matches = set()
+        for token in self._tokens[prefix_range(self._tokens, term)]:
+            matches |= self._postings[token]
+        return matches
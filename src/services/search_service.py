@@ -0,0 +1,209 @@
+import base64
+import json
+import time
+from typing import Any
+
+import orjson
+from sqlalchemy import Select, case, func, literal_column, or_, select, tuple_
+
+from src.cache import decode_entry
+from src.database import dialect_name, fetch_all
+from src.models.model import package
+from src.redis import get_by_keys
+from src.services.search_index import (
+    SearchIndex,
+    SearchRank,
+    normalize_query,
+    query_terms,
+    rank_package,
+    tokenize,
+)
+from src.utils import security
+
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+# no pages are served past this many results for one query
+RESULT_CAP = 500
+FALLBACK_INDEX_TTL = 300
+SEARCH_TTL = 60
+CURSOR_SIGN_PURPOSE = "search-cursor"
+# empty results are cached shorter, so new packages show up sooner
+NEGATIVE_SEARCH_TTL = 30
+
+_fallback_index: SearchIndex | None = None
+_fallback_index_built_at = 0.0
+
+
+def escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def build_search_query(
+    q: str,
+    terms: list[str],
+    limit: int,
+    after: tuple[int, str] | None,
+    with_terms: bool = False,
+) -> Select:
+    """Package name prefix or every term as a word prefix of the document.
+
+    Ranked by SearchRank, keyset paginated by (rank, id). with_terms adds the
+    document words starting with q (used by find_prefix_page).
+    """
+    # stored tsvector, matching and ranking don't rebuild the document per row
+    document = literal_column("package.search_document")
+    name = func.lower(package.c.id)
+    name_prefix = name.like(escape_like(q) + "%", escape="\\")
+    ranks = [
+        (name == q, SearchRank.EXACT_NAME),
+        (name_prefix, SearchRank.NAME_PREFIX),
+    ]
+    match = name_prefix
+    if terms:
+        ranks.append(
+            (document.op("@@")(to_tsquery(terms, "AB")), SearchRank.NAME_OR_SUMMARY)
+        )
+        match = or_(name_prefix, document.op("@@")(to_tsquery(terms)))
+    rank = case(*ranks, else_=SearchRank.DESCRIPTION)
+
+    select_query = select(
+        package.c.id, package.c.summary, package.c.create_at, rank.label("rank")
+    ).filter(match)
+    if after:
+        select_query = select_query.filter(tuple_(rank, package.c.id) > tuple_(*after))
+    if with_terms:
+        lexemes = func.unnest(document).table_valued("lexeme").alias("lexemes")
+        document_terms = (
+            select(func.array_agg(lexemes.c.lexeme))
+            .filter(lexemes.c.lexeme.like(escape_like(q) + "%", escape="\\"))
+            .scalar_subquery()
+        )
+        select_query = select_query.add_columns(
+            func.coalesce(document_terms, literal_column("'{}'")).label("terms")
+        )
+    return select_query.order_by(rank, package.c.id).limit(limit)
+
+
+def to_tsquery(terms: list[str], weights: str = ""):
+    ts_query = " & ".join(f"{term}:*{weights}" for term in terms)
+    return func.to_tsquery(literal_column("'simple'::regconfig"), ts_query)
+
+
+async def search_packages(
+    q: str,
+    limit: int = PAGE_SIZE,
+    after: tuple[int, str] | None = None,
+    with_terms: bool = False,
+) -> list[dict[str, Any]]:
+    q = normalize_query(q)
+    if dialect_name() == "postgresql":
+        select_query = build_search_query(q, query_terms(q), limit, after, with_terms)
+        return await fetch_all(select_query)
+
+    index = await get_fallback_index()
+    return index.search(q, limit, after, with_terms)
+
+
+def encode_cursor(rank: int, package_id: str, seen: int) -> str:
+    """Signed, so a client can't get past RESULT_CAP by changing seen"""
+    payload = base64.urlsafe_b64encode(
+        json.dumps([rank, package_id, seen]).encode("utf-8")
+    ).decode("utf-8")
+    return "{}.{}".format(payload, security.sign(payload, CURSOR_SIGN_PURPOSE))
+
+
+def decode_cursor(cursor: str) -> tuple[int, str, int]:
+    """Raises ValueError for a malformed or forged cursor"""
+    payload, _, signature = cursor.rpartition(".")
+    if not security.verify_sign(payload, signature, CURSOR_SIGN_PURPOSE):
+        raise ValueError("Invalid cursor")
+    try:
+        rank, package_id, seen = json.loads(base64.urlsafe_b64decode(payload))
+    except (TypeError, ValueError) as er:
+        raise ValueError("Invalid cursor") from er
+    if not (isinstance(rank, int) and isinstance(package_id, str)):
+        raise ValueError("Invalid cursor")
+    if not isinstance(seen, int):
+        raise ValueError("Invalid cursor")
+    return rank, package_id, seen
+
+
+def page_cache_key(q: str, cursor: str | None, limit: int) -> str:
+    return "search_{}_{}_{}".format(normalize_query(q), limit, cursor or "")
+
+
+async def search_page(
+    q: str, cursor: str | None = None, limit: int = PAGE_SIZE
+) -> dict[str, Any]:
+    """One page of results and the cursor of the next one (None on the last)"""
+    after, seen = None, 0
+    if cursor:
+        rank, package_id, seen = decode_cursor(cursor)
+        after = (rank, package_id)
+
+    limit = max(min(limit, MAX_PAGE_SIZE, RESULT_CAP - seen), 0)
+    # one extra row tells whether there is a next page
+    with_terms = cursor is None and is_single_word(q)
+    packages = await search_packages(q, limit + 1, after, with_terms) if limit else []
+    next_cursor = None
+    if len(packages) > limit:
+        packages = packages[:limit]
+        last = packages[-1]
+        # the page reaching RESULT_CAP is the last one
+        if seen + limit < RESULT_CAP:
+            next_cursor = encode_cursor(last["rank"], last["id"], seen + limit)
+    return {"packages": packages, "next_cursor": next_cursor}
+
+
+def is_single_word(q: str) -> bool:
+    q = normalize_query(q)
+    return query_terms(q) == [q]
+
+
+async def find_prefix_page(
+    q: str, cursor: str | None, limit: int
+) -> dict[str, Any] | None:
+    """Answer a one word query from a cached shorter prefix of it.
+
+    A first page without next cursor holds every result of its query, and
+    anything matching "reques" also matches "requ", so filtering a complete
+    cached page of a shorter prefix gives the complete result of q.
+    """
+    q = normalize_query(q)
+    if cursor or not is_single_word(q):
+        return None
+
+    keys = [page_cache_key(q[:size], None, limit) for size in range(len(q) - 1, 0, -1)]
+    for cached in await get_by_keys(keys):
+        if not cached or (decoded := decode_entry(cached)) is None:
+            continue
+        if (page := orjson.loads(decoded[0]))["next_cursor"] is None:
+            return {"packages": filter_hits(page["packages"], q), "next_cursor": None}
+    return None
+
+
+def filter_hits(hits: list[dict[str, Any]], q: str) -> list[dict[str, Any]]:
+    results = []
+    for hit in hits:
+        terms = [term for term in hit["terms"] if term.startswith(q)]
+        if not (terms or hit["id"].lower().startswith(q)):
+            continue
+        head_tokens = tokenize(hit["id"]) | tokenize(hit["summary"])
+        rank = rank_package(hit["id"], head_tokens, q, [q])
+        results.append({**hit, "rank": rank, "terms": terms})
+    return sorted(results, key=lambda hit: (hit["rank"], hit["id"]))
+
+
+async def get_fallback_index() -> SearchIndex:
+    global _fallback_index, _fallback_index_built_at
+
+    if (
+        _fallback_index is None
+        or time.monotonic() - _fallback_index_built_at > FALLBACK_INDEX_TTL
+    ):
+        select_query = select(
+            package.c.id, package.c.summary, package.c.description, package.c.create_at
+        )
+        _fallback_index = SearchIndex(await fetch_all(select_query))
+        _fallback_index_built_at = time.monotonic()
+    return _fallback_index
@@ -1,23 +1,52 @@
+from datetime import datetime, timezone
 from typing import Any
 
-from sqlalchemy import insert, update
+import orjson
+from sqlalchemy import DateTime, Integer, bindparam, column, insert, update, values
 from sqlalchemy.future import select
 
-from src.database import execute, fetch_one
+from src import cache
+from src.database import (
+    dialect_name,
+    execute,
+    execute_many,
+    fetch_one,
+    release_connection,
+)
 from src.exceptions import InvalidCredentialsError
+from src.jobs import job_queue, register_job
 from src.models.model import user
 from src.models.schema import RegisterForm
-from src.utils.security import check_password, hash_password
+from src.utils.security import check_password_async, hash_password_async
+
+USER_PROFILE_TTL = 60
+# everything but the password hash, which never leaves the database
+PROFILE_COLUMNS = [c for c in user.c if c.name != "hash_password"]
+
+
+# last login time by user id, waiting for flush_login_times
+_login_times: dict[int, datetime] = {}
+
+
+def user_cache_key(user_id: int) -> str:
+    return f"user_{user_id}"
+
+
+def dump_profile(profile: dict[str, Any] | None) -> bytes:
+    # row keys are sqlalchemy's quoted_name, a str subclass
+    return orjson.dumps(profile, option=orjson.OPT_NON_STR_KEYS)
 
 
 async def create_account(register_form: RegisterForm) -> dict[str, Any] | None:
+    # the hash may queue for a while, don't keep a pool connection meanwhile
+    await release_connection()
     insert_query = (
         insert(user)
         .values(
             {
                 "name": register_form.name,
                 "email": register_form.email,
-                "hash_password": hash_password(register_form.password),
+                "hash_password": await hash_password_async(register_form.password),
             },
         )
         .returning(user)
@@ -29,7 +58,8 @@ async def authenticate_user(email: str, password: str) -> dict[str, Any] | None:
     user_data = await get_user_by_email(email)
     if not user_data:
         raise InvalidCredentialsError("User not found!")
-    if not check_password(password, user_data["hash_password"]):
+    await release_connection()
+    if not await check_password_async(password, user_data["hash_password"]):
         raise InvalidCredentialsError("Password not match!")
 
     return user_data
@@ -40,11 +70,75 @@ async def get_user_by_id(user_id: int) -> dict[str, Any] | None:
     return await fetch_one(select_query)
 
 
+async def get_user_profile(user_id: int) -> dict[str, Any] | None:
+    select_query = select(*PROFILE_COLUMNS).filter(user.c.id == user_id)
+    return await fetch_one(select_query)
+
+
+async def get_cached_user_profile(user_id: int) -> dict[str, Any] | None:
+    """Profile of the user, cached until it changes (see invalidate_user)"""
+    return await cache.get_or_compute(
+        user_cache_key(user_id),
+        lambda: get_user_profile(user_id),
+        loads=orjson.loads,
+        dumps=dump_profile,
+        ttl=USER_PROFILE_TTL,
+    )
+
+
+async def invalidate_user(user_id: int) -> None:
+    await cache.invalidate(user_cache_key(user_id))
+
+
 async def get_user_by_email(email: str) -> dict[str, Any] | None:
     select_query = select(user).filter(user.c.email == email)
     return await fetch_one(select_query)
 
 
-async def update_user_login_at(user_id: int) -> None:
-    update_query = update(user).where(user.c.id == user_id)
-    await execute(update_query)
+def record_login(user_id: int) -> None:
+    # naive utc, like now() of the database server
+    _login_times[user_id] = datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+async def flush_login_times() -> None:
+    """Write the login times recorded since the last flush, as one job"""
+    global _login_times
+
+    if not _login_times:
+        return
+    logins, _login_times = _login_times, {}
+    await job_queue.submit(update_users_login_at, list(logins.items()))
+
+
+@register_job
+async def update_users_login_at(logins: list[tuple[int, datetime | str]]) -> None:
+    """Set login_at of many users with a single statement"""
+    rows = [
+        {
+            "user_id": user_id,
+            # iso strings when the job went through the redis stream
+            "login_at": datetime.fromisoformat(at) if isinstance(at, str) else at,
+        }
+        for user_id, at in logins
+    ]
+    if dialect_name() == "postgresql":
+        # UPDATE "user" SET login_at = logins.login_at FROM (VALUES ...) AS logins
+        login_values = values(
+            column("user_id", Integer), column("login_at", DateTime), name="logins"
+        ).data([(row["user_id"], row["login_at"]) for row in rows])
+        update_query = (
+            update(user)
+            .where(user.c.id == login_values.c.user_id)
+            .values(login_at=login_values.c.login_at)
+        )
+        await execute(update_query)
+    else:
+        update_query = (
+            update(user)
+            .where(user.c.id == bindparam("user_id"))
+            .values(login_at=bindparam("login_at"))
+        )
+        await execute_many((update_query, rows))
+
+    for row in rows:
+        await invalidate_user(row["user_id"])
@@ -0,0 +1,106 @@
+import secrets
+from typing import Any
+
+import orjson
+from starlette.requests import Request
+
+from src import redis
+from src.models.schema import UserProfile
+from src.settings import cookie_settings
+from src.utils import cookie_auth
+
+
+def session_key(session_id: str) -> str:
+    return f"session:{session_id}"
+
+
+def user_sessions_key(user_id: int) -> str:
+    return f"user_sessions:{user_id}"
+
+
+async def create_session(user: UserProfile) -> str:
+    """Start a session of user, returns its id"""
+    session_id = secrets.token_urlsafe(cookie_settings.AUTH_SIZE)
+    payload = orjson.dumps({"user_id": user.id})
+    await prune_user_sessions(user.id)
+    # the index of the user's sessions doesn't expire, sessions slide past any
+    # ttl it could get at login. Ids of expired sessions are pruned instead.
+    async with redis.redis_client.pipeline(transaction=True) as pipe:
+        pipe.set(session_key(session_id), payload, ex=cookie_settings.SESSION_TTL)
+        pipe.sadd(user_sessions_key(user.id), session_id)
+        await pipe.execute()
+    return session_id
+
+
+async def prune_user_sessions(user_id: int) -> None:
+    """Drop ids of expired sessions from the index of the user's sessions"""
+    session_ids = list(await redis.redis_client.smembers(user_sessions_key(user_id)))
+    if not session_ids:
+        return
+    keys = [session_key(sid.decode()) for sid in session_ids]
+    values = await redis.get_by_keys(keys)
+    expired = [sid for sid, value in zip(session_ids, values, strict=True) if not value]
+    if expired:
+        await redis.redis_client.srem(user_sessions_key(user_id), *expired)
+
+
+async def get_session(session_id: str) -> dict[str, Any] | None:
+    """Session payload, each read extends the session by SESSION_TTL"""
+    payload = await redis.redis_client.getex(
+        session_key(session_id), ex=cookie_settings.SESSION_TTL
+    )
+    return orjson.loads(payload) if payload else None
+
+
+async def delete_session(session_id: str) -> None:
+    if (session := await get_session(session_id)) is None:
+        return
+    async with redis.redis_client.pipeline(transaction=True) as pipe:
+        pipe.delete(session_key(session_id))
+        pipe.srem(user_sessions_key(session["user_id"]), session_id)
+        await pipe.execute()
+
+
+async def revoke_user_sessions(user_id: int) -> None:
+    """End every session of the user, on all devices"""
+    session_ids = await redis.redis_client.smembers(user_sessions_key(user_id))
+    keys = [session_key(sid.decode()) for sid in session_ids]
+    await redis.delete_by_keys([*keys, user_sessions_key(user_id)])
+
+
+def is_redis_backend() -> bool:
+    return cookie_settings.SESSION_BACKEND == "redis"
+
+
+async def get_user_id(request: Request) -> int | None:
+    if not is_redis_backend():
+        return cookie_auth.get_user_id_via_auth_cookie(request)
+
+    if not (session_id := request.cookies.get(cookie_settings.NAME_COOKIES)):
+        return None
+    session = await get_session(session_id)
+    return session["user_id"] if session else None
+
+
+async def get_login_cookie_settings(user: UserProfile) -> dict[str, Any]:
+    if not is_redis_backend():
+        return cookie_auth.get_auth_cookies_settings(user.id)
+
+    return {
+        **cookie_auth.get_base_cookie_settings(),
+        "value": await create_session(user),
+    }
+
+
+async def logout(request: Request) -> None:
+    if is_redis_backend() and (
+        session_id := request.cookies.get(cookie_settings.NAME_COOKIES)
+    ):
+        await delete_session(session_id)
+
+
+async def logout_everywhere(user_id: int) -> None:
+    """End all sessions of the user. Signed cookies can't be revoked, with the
+    cookie backend only the current one is removed (by the caller)."""
+    if is_redis_backend():
+        await revoke_user_sessions(user_id)
@@ -0,0 +1,36 @@
+import asyncio
+import functools
+import logging
+from typing import Awaitable, Callable
+
+from src import redis
+
+logger = logging.getLogger(__name__)
+
+
+async def run_periodically(func: Callable[[], Awaitable], interval: float) -> None:
+    """Call func every `interval` seconds until the task is cancelled"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await func()
+        except Exception:
+            logger.exception("Periodic task %s failed", func.__qualname__)
+
+
+def once_per_interval(
+    func: Callable[[], Awaitable], interval: float
+) -> Callable[[], Awaitable]:
+    """func run by only one worker per interval, the first to claim it in redis.
+
+    The claim isn't released, it expires after interval, so the other workers
+    skip their turns meanwhile.
+    """
+
+    @functools.wraps(func)
+    async def run_once() -> None:
+        key = f"lock:{func.__module__}.{func.__qualname__}"
+        if await redis.redis_client.set(key, 1, nx=True, px=int(interval * 1000)):
+            await func()
+
+    return run_once
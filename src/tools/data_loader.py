@@ -1,27 +1,49 @@
+import argparse
 import asyncio
 import datetime
 import json
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, AsyncIterable, AsyncIterator, Awaitable, Callable
 
 import progressbar
 from dateutil.parser import parse
 from sqlalchemy import Insert, func, select
 
-from src.database import execute, fetch_all, fetch_scalar
+from src.database import execute_many, fetch_all, fetch_scalar
 from src.models.model import maintainer, package, release, user
+from src.services import aggr_service
 from src.utils.cookie_auth import try_int
 from src.utils.security import hash_password
 
+BATCH_SIZE = 50
+CONCURRENCY = 4
+WORKERS = os.cpu_count() or 1
+MAX_BIGINT = 2**63 - 1
+PLACEHOLDER_PASSWORD = "123456"
 
-async def main():
+PackageRows = tuple[dict, list[dict], dict | None]
+
+
+async def main(
+    batch_size: int = BATCH_SIZE,
+    concurrency: int = CONCURRENCY,
+    workers: int = WORKERS,
+    shared_hash: bool = False,
+):
     select_query = select(func.count()).select_from(user)
     user_count = await fetch_scalar(select_query)
 
     if user_count == 0:
-        file_data = do_load_files()
-        users = find_users(file_data)
-        db_users = await do_user_import(users)
-        await do_import_packages(file_data, db_users)
+        files = do_load_files()
+        users = {}
+        # files -> parsed in process pool -> users collected -> batched inserts
+        packages = collect_users(stream_packages(files, workers), users)
+        await do_import_packages(packages, len(files), batch_size, concurrency)
+        print("Discovered {:,} users".format(len(users)))
+        await do_user_import(users, workers, shared_hash)
+        await aggr_service.refresh_count_statistics()
 
     await do_summary()
 
@@ -38,19 +60,21 @@ async def do_summary():
     )
 
 
-async def do_user_import(user_lookup: dict[str, str]) -> dict[str, user]:
-    users = []
+async def do_user_import(
+    user_lookup: dict[str, str],
+    workers: int = WORKERS,
+    shared_hash: bool = False,
+) -> dict[str, user]:
     print("Importing users ... ", flush=True)
-    with progressbar.ProgressBar(max_val=len(user_lookup)) as bar:
-        for idx, (email, name) in enumerate(user_lookup.items()):
-            users.append(
-                {
-                    "email": email,
-                    "name": name,
-                    "hash_password": hash_password("123456"),
-                }
-            )
-            bar.update(idx)
+    hashes = await hash_placeholder_passwords(len(user_lookup), workers, shared_hash)
+    users = [
+        {
+            "email": email,
+            "name": name,
+            "hash_password": hash_pw,
+        }
+        for (email, name), hash_pw in zip(user_lookup.items(), hashes, strict=True)
+    ]
     insert_query = Insert(user).values(users).returning(user)
     await fetch_all(insert_query)
 
@@ -58,55 +82,162 @@ async def do_user_import(user_lookup: dict[str, str]) -> dict[str, user]:
     return {u.get("email"): u for u in await fetch_all(select_email)}
 
 
-async def do_import_packages(file_data: list[dict], user_lookup: dict[str, user]):
+async def hash_placeholder_passwords(
+    count: int, workers: int, shared_hash: bool
+) -> list[str]:
+    """bcrypt is slow by design, so hash in a process pool or hash only once"""
+    if shared_hash:
+        return [hash_password(PLACEHOLDER_PASSWORD)] * count
+
+    loop = asyncio.get_running_loop()
+    with (
+        ProcessPoolExecutor(max_workers=workers) as pool,
+        progressbar.ProgressBar(max_value=count) as bar,
+    ):
+        futures = [
+            loop.run_in_executor(pool, hash_password, PLACEHOLDER_PASSWORD)
+            for _ in range(count)
+        ]
+        for idx, future in enumerate(asyncio.as_completed(futures)):
+            await future
+            bar.update(idx + 1)
+    return [future.result() for future in futures]
+
+
+async def do_import_packages(
+    packages: AsyncIterable[PackageRows],
+    total: int,
+    batch_size: int = BATCH_SIZE,
+    concurrency: int = CONCURRENCY,
+):
     error_packages = []
-    print("Importing packages and releases ... ", flush=True)
-    with progressbar.ProgressBar(max_value=len(file_data)) as bar:
-        for idx, p in enumerate(file_data):
+    inserted_rows = 0
+    print(
+        "Importing packages and releases "
+        "(batch size {}, concurrency {}) ... ".format(batch_size, concurrency),
+        flush=True,
+    )
+    started = time.perf_counter()
+
+    with progressbar.ProgressBar(max_value=total) as bar:
+
+        async def write_batch(batch: list[PackageRows]):
+            nonlocal inserted_rows
             try:
-                await load_package(p, user_lookup)
-                bar.update(idx)
+                rows = await load_packages(batch)
             except Exception as x:
-                error_packages.append(
-                    (
-                        p,
-                        " *** Errored out for package {}, {}".format(
-                            p.get("package_name"), x
-                        ),
-                    )
+                error_packages.extend(
+                    " *** Errored out for package {}, {}".format(p[0].get("id"), x)
+                    for p in batch
                 )
-                raise
+            else:
+                inserted_rows += rows
+            bar.update(bar.value + len(batch))
+
+        await run_bounded(batched(packages, batch_size), write_batch, concurrency)
+
+    elapsed = time.perf_counter() - started
+    print(
+        "Inserted {:,} rows in {:.2f} sec ({:,.0f} rows/sec).".format(
+            inserted_rows, elapsed, inserted_rows / elapsed if elapsed else 0
+        )
+    )
     print("Completed packages with {} errors.".format(len(error_packages)))
-    for p, txt in error_packages:
+    for txt in error_packages:
         print(txt)
 
 
-def do_load_files() -> list[dict]:
+async def run_bounded(
+    jobs: AsyncIterable[Any], worker: Callable[[Any], Awaitable], concurrency: int
+):
+    """Run worker over jobs, with at most `concurrency` of them in flight"""
+    semaphore = asyncio.Semaphore(concurrency)
+    tasks = set()
+
+    async def run(job):
+        try:
+            await worker(job)
+        finally:
+            semaphore.release()
+
+    async for job in jobs:
+        # Acquire before scheduling, so the next job isn't pulled from
+        # the iterator until a running one is done
+        await semaphore.acquire()
+        task = asyncio.create_task(run(job))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    await asyncio.gather(*tasks)
+
+
+async def batched(items: AsyncIterable[Any], size: int) -> AsyncIterator[list]:
+    batch = []
+    async for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def stream_packages(
+    files: list[str], workers: int
+) -> AsyncIterator[tuple[PackageRows, dict[str, str]]]:
+    """Parse files in a process pool, yield results as soon as they are ready
+
+    At most `workers * 2` files are parsed or waiting to be consumed at once,
+    so memory doesn't grow with the number of files.
+    """
+    loop = asyncio.get_running_loop()
+    window = workers * 2
+    pending = set()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for f in files:
+            pending.add(loop.run_in_executor(pool, parse_package_file, f))
+            if len(pending) >= window:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for future in done:
+                    yield future.result()
+        for future in asyncio.as_completed(pending):
+            yield await future
+
+
+async def collect_users(
+    parsed: AsyncIterable[tuple[PackageRows, dict[str, str]]],
+    found_users: dict[str, str],
+) -> AsyncIterator[PackageRows]:
+    async for rows, users in parsed:
+        found_users.update(users)
+        yield rows
+
+
+def do_load_files() -> list[str]:
     data_path = os.path.abspath(
         os.path.join(os.path.dirname(__file__), "../../data/pypi-top-100")
     )
     print("Loading files from {}".format(data_path))
     files = get_file_names(data_path)
     print("Found {:,} files, loading ...".format(len(files)), flush=True)
-    return [load_file_data(f) for f in files]
+    return files
 
 
-def find_users(data: list[dict]) -> dict:
-    print("Discovering users...", flush=True)
-    found_users = {}
+def parse_package_file(filename: str) -> tuple[PackageRows, dict[str, str]]:
+    """Runs in a worker process: json file -> db rows and discovered users"""
+    data = load_file_data(filename)
+    return build_package_rows(data), find_users(data)
 
-    for idx, p in enumerate(data):
-        info = p.get("info")
-        found_users.update(
-            get_email_and_name_from_text(info.get("author"), info.get("author_email"))
-        )
-        found_users.update(
-            get_email_and_name_from_text(
-                info.get("maintainer"), info.get("maintainer_email")
-            )
-        )
-    print("Discovered {:,} users".format(len(found_users)))
-    return found_users
+
+def find_users(data: dict) -> dict[str, str]:
+    info = data.get("info")
+    return {
+        **get_email_and_name_from_text(info.get("author"), info.get("author_email")),
+        **get_email_and_name_from_text(
+            info.get("maintainer"), info.get("maintainer_email")
+        ),
+    }
 
 
 def get_email_and_name_from_text(name: str, email: str) -> dict:
@@ -143,57 +274,54 @@ def load_file_data(filename: str) -> dict:
     return data
 
 
-async def load_package(data: dict, user_lookup: dict[str, user]):
-    try:
-        info = data.get("info", {})
-        releases = build_releases(
-            data.get("package_name", "").strip(), data.get("releases", {})
-        )
-        if not (created_date := releases[0].get("created_date")):
-            created_date = datetime.datetime.now()
+async def load_packages(data: list[PackageRows]) -> int:
+    packages, releases, maintainers = [], [], []
+    for package_row, release_rows, maintainer_row in data:
+        packages.append(package_row)
+        releases.extend(release_rows)
+        if maintainer_row:
+            maintainers.append(maintainer_row)
 
-        maintainers_lookup = get_email_and_name_from_text(
-            info.get("maintainer"), info.get("maintainer_email")
-        )
+    return await execute_many(
+        (Insert(package), packages),
+        (Insert(release), releases),
+        (Insert(maintainer), maintainers),
+    )
 
-        insert_query = (
-            Insert(package)
-            .values(
-                {
-                    "id": data.get("package_name", "").strip(),
-                    "create_at": created_date,
-                    "author_name": info.get("author"),
-                    "author_email": info.get("author_email"),
-                    "summary": info.get("summary"),
-                    "description": info.get("description"),
-                    "home_page": info.get("home_page"),
-                    "docs_url": info.get("docs_url"),
-                    "package_url": info.get("package_url"),
-                    "license": detect_license(info.get("license")),
-                },
-            )
-            .returning(package)
-        )
 
-        await execute(insert_query)
-        insert_release = Insert(release).values(releases).returning(release)
-        await execute(insert_release)
-        if maintainers_lookup:
-            insert_maintainer = Insert(maintainer).values(
-                {
-                    "maintainer": list(maintainers_lookup.values())[0],
-                    "maintainer_email": list(maintainers_lookup.keys())[0],
-                    "profile_image_url": info.get("profile_image_url"),
-                    "package_id": data.get("package_name", "").strip(),
-                },
-            )
-            await execute(insert_maintainer)
-    except OverflowError:
-        # What the heck, people just putting fake data in here
-        # Size is terabytes...
-        pass
-    except Exception:
-        raise
+def build_package_rows(data: dict) -> PackageRows:
+    info = data.get("info", {})
+    package_id = data.get("package_name", "").strip()
+    releases = build_releases(package_id, data.get("releases", {}))
+    if not (created_date := releases[0].get("created_date")):
+        created_date = datetime.datetime.now()
+
+    maintainers_lookup = get_email_and_name_from_text(
+        info.get("maintainer"), info.get("maintainer_email")
+    )
+
+    package_row = {
+        "id": package_id,
+        "create_at": created_date,
+        "author_name": info.get("author"),
+        "author_email": info.get("author_email"),
+        "summary": info.get("summary"),
+        "description": info.get("description"),
+        "home_page": info.get("home_page"),
+        "docs_url": info.get("docs_url"),
+        "package_url": info.get("package_url"),
+        "license": detect_license(info.get("license")),
+        "latest_release_at": max((r["create_at"] for r in releases), default=None),
+    }
+    maintainer_row = None
+    if maintainers_lookup:
+        maintainer_row = {
+            "maintainer": list(maintainers_lookup.values())[0],
+            "maintainer_email": list(maintainers_lookup.keys())[0],
+            "profile_image_url": info.get("profile_image_url"),
+            "package_id": package_id,
+        }
+    return package_row, releases, maintainer_row
 
 
 def detect_license(license_text: str) -> str | None:
@@ -215,6 +343,8 @@ def detect_license(license_text: str) -> str | None:
 
 
 def build_releases(package_id: str, releases: dict) -> list[release]:
+    # What the heck, people just putting fake data in here
+    # Size is terabytes...
     db_releases = []
     for k in releases.keys():
         all_releases_for_version = releases.get(k)
@@ -222,6 +352,7 @@ def build_releases(package_id: str, releases: dict) -> list[release]:
             continue
 
         v = all_releases_for_version[-1]
+        size = int(v.get("size", 0))
         major_ver, minor_ver, build_ver = make_version_num(k)
 
         db_releases.append(
@@ -233,7 +364,7 @@ def build_releases(package_id: str, releases: dict) -> list[release]:
                 "create_at": parse(v.get("upload_time")),
                 "comment": v.get("comment_text"),
                 "url": v.get("url"),
-                "size": int(v.get("size", 0)),
+                "size": size if size <= MAX_BIGINT else None,
             },
         )
 
@@ -268,5 +399,41 @@ def get_file_names(data_path: str) -> list[str]:
     return files
 
 
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Load PyPI json data into DB")
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=BATCH_SIZE,
+        help="packages inserted per transaction",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=CONCURRENCY,
+        help="batches written at the same time",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=WORKERS,
+        help="processes used to parse json files and hash passwords",
+    )
+    parser.add_argument(
+        "--shared-password-hash",
+        action="store_true",
+        help="hash the placeholder password once and reuse it for all users",
+    )
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
-    asyncio.run(main())
+    args = parse_args()
+    asyncio.run(
+        main(
+            args.batch_size,
+            args.concurrency,
+            args.workers,
+            args.shared_password_hash,
+        )
+    )
@@ -1,3 +1,4 @@
+import functools
 from typing import Any
 
 from fastapi import Request
@@ -6,18 +7,23 @@ from src.exceptions import AuthRequiredError
 from src.settings import cookie_settings
 from src.utils import security
 
+AUTH_COOKIE_CACHE_SIZE = 4096
 
-def get_auth_cookies_settings(
-    user_id: int,
-) -> dict[str, Any]:
-    base_cookie = {
+
+def get_base_cookie_settings() -> dict[str, Any]:
+    return {
         "key": cookie_settings.NAME_COOKIES,
         "httponly": cookie_settings.HTTP_ONLY_COOKIES,
         "samesite": cookie_settings.SAMESITE_COOKIES,
         "secure": cookie_settings.SECURE_COOKIES,
     }
+
+
+def get_auth_cookies_settings(
+    user_id: int,
+) -> dict[str, Any]:
     return {
-        **base_cookie,
+        **get_base_cookie_settings(),
         "value": __get_val(user_id),
     }
 
@@ -32,7 +38,16 @@ def get_user_id_via_auth_cookie(request: Request) -> int | None:
     if cookie_settings.NAME_COOKIES not in request.cookies:
         return None
 
-    cookies = request.cookies[cookie_settings.NAME_COOKIES]
+    return verify_auth_cookie(request.cookies[cookie_settings.NAME_COOKIES])
+
+
+@functools.lru_cache(maxsize=AUTH_COOKIE_CACHE_SIZE)
+def verify_auth_cookie(cookies: str) -> int | None:
+    """User id of a signed cookie value.
+
+    The result only depends on the value, so it is kept for the cookies seen
+    last, an invalid value raises and isn't cached.
+    """
     parts = cookies.split(":")
     if len(parts) != 2:
         return None
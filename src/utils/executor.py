@@ -0,0 +1,51 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+
+class BoundedExecutor:
+    """Thread pool for blocking calls with a bounded queue.
+
+    At most `max_workers + max_queue` calls are handed to the pool, the rest
+    wait on the event loop (without blocking it) until a slot is free.
+    """
+
+    def __init__(self, max_workers: int, max_queue: int, name: str):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.waiting = 0
+        self.in_flight = 0
+        self.completed = 0
+        self._slots = asyncio.Semaphore(max_workers + max_queue)
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix=name
+        )
+
+    async def run(self, func: Callable[..., Any], *args: Any) -> Any:
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, func, *args)
+        finally:
+            self.in_flight -= 1
+            self.completed += 1
+            self._slots.release()
+
+    @property
+    def running(self) -> int:
+        return min(self.in_flight, self.max_workers)
+
+    @property
+    def queue_depth(self) -> int:
+        """Calls waiting for a free worker thread"""
+        return self.waiting + self.in_flight - self.running
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True, cancel_futures=True)
@@ -4,7 +4,31 @@ from hmac import compare_digest
 
 import bcrypt
 
-from src.settings import cookie_settings
+from src.metrics import CounterFunc, Gauge
+from src.settings import cookie_settings, settings
+from src.utils.executor import BoundedExecutor
+
+# bcrypt releases the GIL, so a thread pool hashes in parallel
+password_executor = BoundedExecutor(
+    max_workers=settings.PASSWORD_HASH_WORKERS,
+    max_queue=settings.PASSWORD_HASH_QUEUE_SIZE,
+    name="password-hash",
+)
+Gauge(
+    "password_hash_queue_depth",
+    "Password hashes waiting for a thread",
+    lambda: password_executor.queue_depth,
+)
+Gauge(
+    "password_hash_running",
+    "Password hashes being computed",
+    lambda: password_executor.running,
+)
+CounterFunc(
+    "password_hashes_total",
+    "Password hashes and checks done",
+    lambda: password_executor.completed,
+)
 
 
 def hash_password(password: str) -> str:
@@ -19,6 +43,30 @@ def check_password(password: str, password_in_db: str) -> bool:
     return bcrypt.checkpw(pw_bytes, pw_in_db_bytes)
 
 
+async def hash_password_async(password: str) -> str:
+    return await password_executor.run(hash_password, password)
+
+
+async def check_password_async(password: str, password_in_db: str) -> bool:
+    return await password_executor.run(check_password, password, password_in_db)
+
+
+def sign(value: str, purpose: str) -> str:
+    """Signature of value, only valid for the same purpose (e.g. a search
+    cursor can't be passed off as an auth cookie)"""
+    h = blake2b(
+        digest_size=cookie_settings.AUTH_SIZE,
+        key=cookie_settings.SECRET_KEY,
+        person=purpose.encode("utf-8"),
+    )
+    h.update(value.encode("utf-8"))
+    return h.hexdigest()
+
+
+def verify_sign(value: str, signature: str, purpose: str) -> bool:
+    return signature.isascii() and compare_digest(sign(value, purpose), signature)
+
+
 def __sign(cookie: str) -> str:
     h = blake2b(digest_size=cookie_settings.AUTH_SIZE, key=cookie_settings.SECRET_KEY)
     h.update(cookie.encode("utf-8"))
@@ -6,12 +6,13 @@ from starlette.requests import Request
 from starlette.responses import RedirectResponse
 from starlette.templating import Jinja2Templates
 
+from src import sessions
 from src.dependencies import get_templates, get_user_id_from_cookie
 from src.exceptions import (
     AuthRequiredError,
     NotFoundError,
 )
-from src.models.schema import AccountPageView, User
+from src.models.schema import AccountPageView, UserProfile
 from src.services import user_service
 from src.settings import cookie_settings
 
@@ -27,8 +28,10 @@ async def get_account(
     if not user_id:
         raise AuthRequiredError("Unauthorized access!")
     view_account = AccountPageView(user_id=user_id)
+    if not (profile := await user_service.get_cached_user_profile(user_id)):
+        raise NotFoundError("User not found")
     try:
-        view_account.user = User(**await user_service.get_user_by_id(user_id))
+        view_account.user = UserProfile(**profile)
     except ValidationError as er:
         error = er.errors()[0]
         raise NotFoundError(error["msg"]) from er
@@ -38,7 +41,26 @@ async def get_account(
 
 
 @router.get("/logout", response_class=RedirectResponse, include_in_schema=False)
-async def get_logout():
+async def get_logout(
+        request: Request,
+        user_id: int = Depends(get_user_id_from_cookie),
+):
+    if user_id:
+        await user_service.invalidate_user(user_id)
+    await sessions.logout(request)
+    response = RedirectResponse(url="/", status_code=status.HTTP_302_FOUND)
+    response.delete_cookie(cookie_settings.NAME_COOKIES)
+    return response
+
+
+@router.get("/logout-all", response_class=RedirectResponse, include_in_schema=False)
+async def get_logout_all(
+        request: Request,
+        user_id: int = Depends(get_user_id_from_cookie),
+):
+    if user_id:
+        await user_service.invalidate_user(user_id)
+        await sessions.logout_everywhere(user_id)
     response = RedirectResponse(url="/", status_code=status.HTTP_302_FOUND)
     response.delete_cookie(cookie_settings.NAME_COOKIES)
     return response
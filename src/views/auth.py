@@ -1,4 +1,4 @@
-from fastapi import APIRouter, BackgroundTasks, Form
+from fastapi import APIRouter, Form
 from pydantic import ValidationError
 from starlette import status
 from starlette.requests import Request
@@ -14,7 +14,7 @@ from src.exceptions import (
 )
 from src.models.schema import LoginForm, RegisterForm, User
 from src.services import user_service
-from src.utils.cookie_auth import get_auth_cookies_settings
+from src.sessions import get_login_cookie_settings
 
 router = APIRouter()
 templates: Jinja2Templates = get_templates()
@@ -46,7 +46,7 @@ async def post_register_form(
     user_account = await user_service.create_account(register_form)
     user = User(**user_account)
     response = RedirectResponse(url="/account/me", status_code=status.HTTP_302_FOUND)
-    response.set_cookie(**get_auth_cookies_settings(user.id))
+    response.set_cookie(**await get_login_cookie_settings(user))
 
     return response
 
@@ -60,7 +60,6 @@ async def get_login_form(
 
 @router.post("/login", response_class=HTMLResponse)
 async def post_login_form(
-        worker: BackgroundTasks,
         email: str = Form(),
         password: str = Form(),
 ):
@@ -75,8 +74,8 @@ async def post_login_form(
     except InvalidCredentialsError as er:
         raise AuthorizationError(er, template="auth/login.html") from er
 
-    worker.add_task(user_service.update_user_login_at, user.id)
+    user_service.record_login(user.id)
 
     response = RedirectResponse("/account/me", status_code=status.HTTP_302_FOUND)
-    response.set_cookie(**get_auth_cookies_settings(user.id))
+    response.set_cookie(**await get_login_cookie_settings(user))
     return response
@@ -2,14 +2,44 @@ import fastapi
 from fastapi import Depends
 from starlette.requests import Request
 from starlette.responses import HTMLResponse
-from starlette.templating import Jinja2Templates
 
-from src.dependencies import get_templates, get_user_id_from_cookie
+from src import cache
+from src.dependencies import get_user_id_from_cookie
 from src.models.schema import HomePageView, Package, ViewModelBase
+from src.response_cache import PageTemplate, cached_response
 from src.services import aggr_service, package_service
 
 router = fastapi.APIRouter()
-templates: Jinja2Templates = get_templates()
+
+HOME_TTL = 60
+ABOUT_TTL = 3600
+HOME_VIEW_KEY = "home_view"
+
+
+def dump_home_view(view: HomePageView) -> str:
+    return view.model_dump_json(exclude={"user_id", "is_logged_in"})
+
+
+async def load_home_view() -> HomePageView:
+    stats_counts = await aggr_service.get_count_statistics()
+    # rows of our own database, no need to validate them
+    return HomePageView.model_construct(
+        packages=[
+            Package.model_construct(**p)
+            for p in await package_service.latest_packages(limit=7)
+        ],
+        **stats_counts,
+    )
+
+
+async def get_home_view() -> HomePageView:
+    return await cache.get_or_compute(
+        HOME_VIEW_KEY,
+        load_home_view,
+        loads=HomePageView.model_validate_json,
+        dumps=dump_home_view,
+        ttl=HOME_TTL,
+    )
 
 
 @router.get("/", response_class=HTMLResponse, include_in_schema=False)
@@ -17,16 +47,16 @@ async def index(
     request: Request,
     user_id: int = Depends(get_user_id_from_cookie),
 ):
-    stats_counts = await aggr_service.get_count_statistics()
-    home_page_view = HomePageView(user_id=user_id, **stats_counts)
-    home_page_view.packages = [
-        Package(**p) for p in await package_service.latest_packages(limit=7)
-    ]
-    return templates.TemplateResponse(
-        request=request,
-        name="home/index.html",
-        context=home_page_view.model_dump(),
-    )
+    async def render():
+        home_view = await get_home_view()
+        # the cached view is shared between requests, don't modify it
+        home_page_view = home_view.model_copy(update={"user_id": user_id})
+        return PageTemplate(
+            name="home/index.html",
+            context=home_page_view.template_context(),
+        )
+
+    return await cached_response(request, user_id, render, ttl=HOME_TTL)
 
 
 @router.get("/about", response_class=HTMLResponse, include_in_schema=False)
@@ -34,9 +64,11 @@ async def about(
     request: Request,
     user_id: int = Depends(get_user_id_from_cookie),
 ):
-    view_base = ViewModelBase(user_id=user_id)
-    return templates.TemplateResponse(
-        request=request,
-        name="home/about.html",
-        context=view_base.model_dump(),
-    )
+    async def render():
+        view_base = ViewModelBase(user_id=user_id)
+        return PageTemplate(
+            name="home/about.html",
+            context=view_base.template_context(),
+        )
+
+    return await cached_response(request, user_id, render, ttl=ABOUT_TTL)
@@ -0,0 +1,11 @@
+import fastapi
+from starlette.responses import PlainTextResponse
+
+from src.metrics import render_metrics
+
+router = fastapi.APIRouter()
+
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics() -> PlainTextResponse:
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
@@ -1,52 +1,61 @@
 import fastapi
-from fastapi import BackgroundTasks, Depends
+from fastapi import Depends
 from starlette.requests import Request
 from starlette.responses import HTMLResponse
-from starlette.templating import Jinja2Templates
 
+from src import cache
 from src.dependencies import (
-    get_package_from_cache,
-    get_templates,
     get_user_id_from_cookie,
+    package_cache_key,
 )
 from src.models.schema import DetailPackageView
-from src.redis import RedisData, set_redis_key
+from src.response_cache import PageTemplate, cached_response
 from src.services import aggr_service
 
 router = fastapi.APIRouter(prefix="/project")
-templates: Jinja2Templates = get_templates()
+
+PACKAGE_TTL = 60
+
+
+def dump_package_view(view: DetailPackageView) -> str:
+    return view.model_dump_json(exclude={"user_id", "is_logged_in"})
+
+
+async def load_package_view(package_name: str) -> DetailPackageView:
+    package_details = await aggr_service.get_package_details(package_name)
+    return DetailPackageView(**package_details)
+
+
+async def get_package_view(package_name: str) -> DetailPackageView:
+    return await cache.get_or_compute(
+        package_cache_key(package_name),
+        lambda: load_package_view(package_name),
+        loads=DetailPackageView.model_validate_json,
+        dumps=dump_package_view,
+        ttl=PACKAGE_TTL,
+    )
 
 
 @router.get("/{package_name}", response_class=HTMLResponse)
 async def get_package_details(
-    worker: BackgroundTasks,
     request: Request,
     package_name: str,
     user_id: int = Depends(get_user_id_from_cookie),
-    package_cache: str = Depends(get_package_from_cache),
 ):
-    if not package_cache:
-        package_details = await aggr_service.get_package_details(package_name)
-        view_details = DetailPackageView(user_id=user_id, **package_details)
-        redis_data = RedisData(
-            key="package_" + package_name.strip(),
-            value=view_details.model_dump_json(exclude={"user_id", "is_logged_in"}),
-            ttl=60,
-        )
-        worker.add_task(set_redis_key, redis_data)
-    else:
-        view_details = DetailPackageView.model_validate_json(package_cache)
-        view_details.user_id = user_id
-    if not view_details.package:
-        return templates.TemplateResponse(
-            request=request,
-            name="error/error.html",
-            context={
-                "context": f"{package_name} not found",
-            },
+    async def render():
+        package_view = await get_package_view(package_name)
+        # the cached view is shared between requests, don't modify it
+        view_details = package_view.model_copy(update={"user_id": user_id})
+        if not view_details.package:
+            return PageTemplate(
+                name="error/error.html",
+                context={
+                    "context": f"{package_name} not found",
+                },
+            )
+        return PageTemplate(
+            name="packages/packages.html",
+            context=view_details.template_context(),
         )
-    return templates.TemplateResponse(
-        request=request,
-        name="packages/packages.html",
-        context=view_details.model_dump(),
-    )
+
+    return await cached_response(request, user_id, render, ttl=PACKAGE_TTL)
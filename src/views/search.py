@@ -1,47 +1,102 @@
 import fastapi
-from fastapi import BackgroundTasks, Depends, Query
+from fastapi import Depends, HTTPException, Query
 from starlette.requests import Request
-from starlette.responses import HTMLResponse
-from starlette.templating import Jinja2Templates
+from starlette.responses import HTMLResponse, Response
 
+from src import cache
 from src.dependencies import (
-    get_search_from_cache,
-    get_templates,
     get_user_id_from_cookie,
 )
-from src.exceptions import NotFoundError
-from src.models.schema import Package, SearchPageView
-from src.redis import RedisData, set_redis_key
-from src.services.package_service import search_packages_by_id
+from src.exceptions import InvalidInputError, NotFoundError
+from src.models.schema import SearchApiPage, SearchPageView, SearchResultPage
+from src.response_cache import PageTemplate, cached_response
+from src.services import search_service
 
 router = fastapi.APIRouter(prefix="/search")
-templates: Jinja2Templates = get_templates()
+
+# internal fields of a cached page, not part of the API (see SearchApiPage)
+API_EXCLUDE = {"packages": {"__all__": {"terms"}}}
+
+
+def search_ttl(page: SearchResultPage) -> int:
+    if page.packages:
+        return search_service.SEARCH_TTL
+    return search_service.NEGATIVE_SEARCH_TTL
+
+
+def rendered_search_ttl(page: PageTemplate) -> int:
+    if page.context.get("packages"):
+        return search_service.SEARCH_TTL
+    return search_service.NEGATIVE_SEARCH_TTL
+
+
+async def load_search_page(q: str, cursor: str | None, limit: int) -> SearchResultPage:
+    page_data = await search_service.find_prefix_page(
+        q, cursor, limit
+    ) or await search_service.search_page(q, cursor, limit)
+    return SearchResultPage(**page_data)
+
+
+async def get_search_page(q: str, cursor: str | None, limit: int) -> SearchResultPage:
+    """Raises ValueError for an invalid cursor"""
+    return await cache.get_or_compute(
+        search_service.page_cache_key(q, cursor, limit),
+        lambda: load_search_page(q, cursor, limit),
+        loads=SearchResultPage.model_validate_json,
+        dumps=SearchResultPage.model_dump_json,
+        ttl=search_ttl,
+    )
 
 
 @router.get("/", response_class=HTMLResponse)
 async def search(
-        worker: BackgroundTasks,
         request: Request,
-        q: str | None = Query(),
+        q: str | None = Query(max_length=100),
+        cursor: str | None = Query(default=None),
+        limit: int = Query(
+            default=search_service.PAGE_SIZE, ge=1, le=search_service.MAX_PAGE_SIZE
+        ),
         user_id: int = Depends(get_user_id_from_cookie),
-        search_cache: str = Depends(get_search_from_cache),
 ):
-    page_view = SearchPageView(user_id=user_id)
     if not q:
         raise NotFoundError(template="search/search.html")
-    if not search_cache:
-        page_view.packages = [Package(**p) for p in await search_packages_by_id(q)]
-        redis_data = RedisData(
-            key="search_" + q.strip(),
-            value=page_view.model_dump_json(exclude={"user_id", "is_logged_in"}),
-            ttl=60,
+
+    async def render():
+        try:
+            page = await get_search_page(q, cursor, limit)
+        except ValueError as er:
+            raise InvalidInputError(str(er), template="search/search.html") from er
+        page_view = SearchPageView.model_construct(
+            user_id=user_id, packages=page.packages, next_cursor=page.next_cursor
         )
-        worker.add_task(set_redis_key, redis_data)
-    else:
-        page_view.model_validate_json(search_cache)
-        page_view.user_id = user_id
-    return templates.TemplateResponse(
-        request=request,
-        name="search/search.html",
-        context=page_view.model_dump(),
+        return PageTemplate(
+            name="search/search.html",
+            context=page_view.template_context(),
+        )
+
+    return await cached_response(
+        request,
+        user_id,
+        render,
+        ttl=rendered_search_ttl,
+        params={"q": q, "cursor": cursor, "limit": limit},
+    )
+
+
+@router.get("/api", response_model=SearchApiPage)
+async def search_api(
+        q: str = Query(min_length=1, max_length=100),
+        cursor: str | None = Query(default=None),
+        limit: int = Query(
+            default=search_service.PAGE_SIZE, ge=1, le=search_service.MAX_PAGE_SIZE
+        ),
+):
+    try:
+        page = await get_search_page(q, cursor, limit)
+    except ValueError as er:
+        raise HTTPException(status_code=400, detail=str(er)) from er
+    # serialized straight from the model, response_model is kept for the docs
+    return Response(
+        content=page.model_dump_json(exclude=API_EXCLUDE),
+        media_type="application/json",
     )
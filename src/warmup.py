@@ -0,0 +1,49 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable
+
+from src.services import package_service
+from src.settings import settings
+from src.views.home import get_home_view
+from src.views.package import get_package_view
+
+logger = logging.getLogger(__name__)
+
+
+async def warm_up_cache(
+    packages: int = settings.WARMUP_PACKAGES,
+    concurrency: int = settings.WARMUP_CONCURRENCY,
+) -> None:
+    """Fill the cache with the home page and the most recently released
+    packages, so the first requests after a deploy or a redis flush don't
+    all go to the database.
+
+    Values that are already cached are left alone, the cache computes each
+    key once even if requests ask for it meanwhile.
+    """
+    started = time.monotonic()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def warm_up(get_view: Callable[..., Awaitable], *args) -> bool:
+        async with semaphore:
+            try:
+                await get_view(*args)
+            except Exception:
+                logger.exception(
+                    "Cache warm-up of %s%s failed", get_view.__name__, args
+                )
+                return False
+            return True
+
+    latest = await package_service.latest_packages(limit=packages) if packages else []
+    results = await asyncio.gather(
+        warm_up(get_home_view),
+        *(warm_up(get_package_view, p["id"]) for p in latest),
+    )
+    logger.info(
+        "Warmed up %s of %s cache entries in %.2fs",
+        sum(results),
+        len(results),
+        time.monotonic() - started,
+    )
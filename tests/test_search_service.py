@@ -0,0 +1,98 @@
+import asyncio
+import base64
+import json
+from datetime import datetime
+
+import pytest
+
+from src.exceptions import AuthRequiredError
+from src.services import search_service
+from src.utils import cookie_auth, security
+
+
+def make_hits(count: int) -> list[dict]:
+    return [
+        {
+            "id": f"package-{i:04}",
+            "summary": "",
+            "create_at": datetime(2024, 1, 1),
+            "rank": 1,
+            "terms": [],
+        }
+        for i in range(count)
+    ]
+
+
+@pytest.fixture
+def hits(monkeypatch):
+    """search_packages over a fixed, ranked list of results"""
+    results = make_hits(100)
+
+    async def search_packages(q, limit, after=None, with_terms=False):
+        rows = [r for r in results if after is None or (r["rank"], r["id"]) > after]
+        return rows[:limit]
+
+    monkeypatch.setattr(search_service, "search_packages", search_packages)
+    return results
+
+
+def fetch_pages(q: str, limit: int) -> list[dict]:
+    pages, cursor = [], None
+    while True:
+        page = asyncio.run(search_service.search_page(q, cursor, limit))
+        pages.append(page)
+        if (cursor := page["next_cursor"]) is None:
+            return pages
+
+
+def test_cursor_round_trip():
+    cursor = search_service.encode_cursor(2, "requests", 40)
+    assert search_service.decode_cursor(cursor) == (2, "requests", 40)
+
+
+@pytest.mark.parametrize("cursor", ["", "!!!", "é.x", "e30=.", "e30=.00"])
+def test_malformed_cursor(cursor):
+    with pytest.raises(ValueError):
+        search_service.decode_cursor(cursor)
+
+
+def test_forged_cursor():
+    cursor = search_service.encode_cursor(2, "requests", 480)
+    payload, _, signature = cursor.partition(".")
+    # lowering seen to get past RESULT_CAP
+    forged = base64.urlsafe_b64encode(json.dumps([2, "requests", 0]).encode())
+    with pytest.raises(ValueError):
+        search_service.decode_cursor(f"{forged.decode()}.{signature}")
+    # signed like an auth cookie (no purpose)
+    with pytest.raises(ValueError):
+        search_service.decode_cursor(
+            "{}.{}".format(payload, security.sign(payload, purpose=""))
+        )
+
+
+def test_cursor_is_not_an_auth_cookie():
+    cursor = search_service.encode_cursor(0, "requests", 0)
+    payload, _, signature = cursor.partition(".")
+    with pytest.raises(AuthRequiredError):
+        cookie_auth.verify_auth_cookie(f"{security.b64e(payload)}:{signature}")
+
+
+def test_pages_stop_at_result_cap(hits, monkeypatch):
+    monkeypatch.setattr(search_service, "RESULT_CAP", 40)
+    pages = fetch_pages("package", limit=20)
+    assert [len(page["packages"]) for page in pages] == [20, 20]
+    assert [p["id"] for page in pages for p in page["packages"]] == [
+        h["id"] for h in hits[:40]
+    ]
+
+
+def test_last_page_below_result_cap(hits, monkeypatch):
+    monkeypatch.setattr(search_service, "RESULT_CAP", 500)
+    pages = fetch_pages("package", limit=30)
+    assert [len(page["packages"]) for page in pages] == [30, 30, 30, 10]
+
+
+def test_page_size_shrinks_at_result_cap(hits, monkeypatch):
+    monkeypatch.setattr(search_service, "RESULT_CAP", 50)
+    pages = fetch_pages("package", limit=20)
+    assert [len(page["packages"]) for page in pages] == [20, 20, 10]